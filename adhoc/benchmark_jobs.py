@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of process_excel_file for the RU and US workers.
+Generates synthetic workbooks in the layout each worker expects, runs them against
+the local stand-in (adhoc/upstream_stub.py) and prints wall time, requests per second,
+peak RSS and the per-stage breakdown as JSON. Compare against a stored baseline with
+--baseline to flag regressions.
+
+    python adhoc/benchmark_jobs.py --rows 100 --rows 1000 --save-baseline adhoc/benchmark_baseline.json
+    python adhoc/benchmark_jobs.py --rows 100 --rows 1000 --baseline adhoc/benchmark_baseline.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import resource
+import subprocess
+import urllib.request
+from pathlib import Path
+from datetime import datetime
+
+import openpyxl
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from upstream_stub import synthetic_ticker, synthetic_investing_url
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(message)s',
+    handlers=[logging.StreamHandler(sys.stderr)]
+)
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parent.parent
+SERVICES = {
+    'ru': ROOT / 'parser_service',
+    'us': ROOT / 'us-parser-service',
+}
+# Lift the production pacing so the benchmark measures the worker, not the politeness caps
+BENCHMARK_ENV = {
+    'INVESTING_RATE_INITIAL': '1000',
+    'INVESTING_RATE_MAX': '1000',
+    'INVESTING_WINDOW_INITIAL': '50',
+    'INVESTING_WINDOW_MAX': '50',
+    'DISTRIBUTED_LIMITER': '0',
+    'CIRCUIT_BREAKER_THRESHOLD': '1000000',
+    'INVESTING_RETRY_DELAY': '0',
+}
+# Lower is better for every compared metric
+COMPARED_METRICS = ['wall_time', 'peak_rss_mb']
+
+
+def build_workbook(service: str, rows: int, date: datetime) -> bytes:
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.cell(1, 4).value = date.strftime('%d.%m.%Y')
+    ws.cell(2, 2).value = "ISIN"
+    ws.cell(2, 3).value = "Наименование"
+
+    for i in range(rows):
+        row_num = 4 + i
+        ws.cell(row_num, 2).value = f"XX{i:010d}"
+        ws.cell(row_num, 3).value = f"Synthetic {i:05d}"
+        if service == 'ru':
+            ws.cell(row_num, 14).value = synthetic_investing_url(i)
+            ws.cell(row_num, 15).value = synthetic_ticker(i)
+        else:
+            ws.cell(row_num, 9).value = synthetic_investing_url(i)
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def _stub_get(stub_url: str, path: str) -> dict:
+    with urllib.request.urlopen(f"{stub_url}{path}", timeout=10) as response:
+        return json.loads(response.read())
+
+
+def _stub_reset(stub_url: str):
+    request = urllib.request.Request(f"{stub_url}/_reset", method='POST')
+    urllib.request.urlopen(request, timeout=10).close()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_stub(args) -> tuple[subprocess.Popen, str]:
+    port = args.stub_port or _free_port()
+    stub_url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(
+        [sys.executable, str(Path(__file__).resolve().parent / 'upstream_stub.py'),
+         '--port', str(port),
+         '--latency', args.latency,
+         '--latency-mean', str(args.latency_mean),
+         '--latency-spread', str(args.latency_spread),
+         '--moex-securities', str(max(args.rows)),
+         '--seed', str(args.seed)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            _stub_get(stub_url, '/_stats')
+            return process, stub_url
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"Upstream stub did not start on {stub_url}")
+
+
+def run_case(service: str, workbook: Path, date: str) -> dict:
+    # Runs inside a fresh interpreter: both services ship a top-level async_impl package
+    # and module-level limiter/session state must not leak between cases
+    sys.path.insert(0, str(SERVICES[service]))
+    logging.getLogger().setLevel(logging.WARNING)
+
+    import parser_worker
+    from async_impl import JobStats, close_sessions
+
+    async def run() -> dict:
+        stats = JobStats()
+        try:
+            await parser_worker.process_excel_file(workbook.read_bytes(), datetime.strptime(date, '%Y-%m-%d'), stats=stats)
+        finally:
+            await close_sessions()
+        return stats.as_dict()
+
+    started = time.perf_counter()
+    stats = asyncio.run(run())
+    return {
+        'wall_time': round(time.perf_counter() - started, 3),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'stats': stats,
+    }
+
+
+def benchmark(service: str, rows: int, date: datetime, stub_url: str, workdir: Path) -> dict:
+    workbook = workdir / f"benchmark_{service}_{rows}.xlsx"
+    workbook.write_bytes(build_workbook(service, rows, date))
+
+    _stub_reset(stub_url)
+    env = {**os.environ, **BENCHMARK_ENV, 'UPSTREAM_OVERRIDE': stub_url}
+    completed = subprocess.run(
+        [sys.executable, __file__, '--run-case', service, str(workbook), date.strftime('%Y-%m-%d')],
+        env=env, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"{service}/{rows} failed:\n{completed.stderr}")
+
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    upstream = _stub_get(stub_url, '/_stats')['hosts']
+    requests = sum(host['requests'] for host in upstream.values())
+    result.update({
+        'service': service,
+        'rows': rows,
+        'requests': requests,
+        'requests_per_second': round(requests / result['wall_time'], 2) if result['wall_time'] else 0,
+        'rows_per_second': round(rows / result['wall_time'], 2) if result['wall_time'] else 0,
+        'upstream': {host: s['requests'] for host, s in upstream.items()},
+    })
+    return result
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    previous = {(r['service'], r['rows']): r for r in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result['service'], result['rows']))
+        if before is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if before[metric] and result[metric] > before[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{result['service']}/{result['rows']} {metric}: {before[metric]} -> {result[metric]} "
+                    f"(+{(result[metric] / before[metric] - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def main():
+    if len(sys.argv) == 5 and sys.argv[1] == '--run-case':
+        print(json.dumps(run_case(sys.argv[2], Path(sys.argv[3]), sys.argv[4])))
+        return
+
+    parser = argparse.ArgumentParser(description='End-to-end benchmark of the parser workers on synthetic workbooks')
+    parser.add_argument('-s', '--service', action='append', choices=list(SERVICES), help='Service (repeatable, default: all)')
+    parser.add_argument('-n', '--rows', action='append', type=int, help='Row count (repeatable, default: 100 and 1000)')
+    parser.add_argument('--date', default='2025-03-14', help='Target date, YYYY-MM-DD')
+    parser.add_argument('--latency', default='lognormal', choices=['fixed', 'uniform', 'normal', 'lognormal'])
+    parser.add_argument('--latency-mean', type=float, default=0.05)
+    parser.add_argument('--latency-spread', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--stub-port', type=int, help='Port for the upstream stub (default: any free port)')
+    parser.add_argument('--workdir', default='/tmp/parser_benchmark', help='Where generated workbooks are kept')
+    parser.add_argument('--baseline', help='Baseline JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Allowed slowdown vs baseline, share')
+    parser.add_argument('--save-baseline', help='Write the results to this file')
+    args = parser.parse_args()
+    args.service = args.service or list(SERVICES)
+    args.rows = args.rows or [100, 1000]
+
+    date = datetime.strptime(args.date, '%Y-%m-%d')
+    workdir = Path(args.workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+
+    stub, stub_url = start_stub(args)
+    results = []
+    try:
+        for service in args.service:
+            for rows in args.rows:
+                logger.info(f"Running {service} with {rows} rows...")
+                result = benchmark(service, rows, date, stub_url, workdir)
+                logger.info(
+                    f"  {result['wall_time']}s, {result['rows_per_second']} rows/s, "
+                    f"{result['requests_per_second']} req/s, peak RSS {result['peak_rss_mb']} MB"
+                )
+                results.append(result)
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(results, indent=2, ensure_ascii=False))
+        logger.info(f"Baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for regression in regressions:
+            logger.warning(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        logger.info(f"No regressions beyond {args.tolerance:.0%} vs {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
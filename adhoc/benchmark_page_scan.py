@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the Investing page extraction: the byte-level __NEXT_DATA__ scan
+against the full BeautifulSoup parse it falls back to. Pages are generated like the
+upstream stub serves them, --filler-kb sets how much markup surrounds the values
+(real instrument pages are several hundred KB).
+
+    python adhoc/benchmark_page_scan.py --service us --filler-kb 50 --filler-kb 500
+"""
+import sys
+import json
+import timeit
+import logging
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from upstream_stub import investing_page_html
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(message)s',
+    handlers=[logging.StreamHandler(sys.stderr)]
+)
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parent.parent
+SERVICES = {
+    'ru': (ROOT / 'parser_service', 'extract_instrument_id', '_extract_instrument_id_soup'),
+    'us': (ROOT / 'us-parser-service', 'extract_instrument', '_extract_instrument_soup'),
+}
+# one filler row of the stub page is ~220 bytes
+FILLER_ROW_BYTES = 220
+
+
+def measure(func, page: bytes, number: int) -> float:
+    return min(timeit.repeat(lambda: func(page), number=number, repeat=5)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Byte scan vs BeautifulSoup on synthetic Investing pages')
+    parser.add_argument('-s', '--service', default='us', choices=list(SERVICES))
+    parser.add_argument('-k', '--filler-kb', action='append', type=int, help='Page filler in KB (repeatable, default: 50 and 500)')
+    parser.add_argument('-n', '--number', type=int, default=20, help='Calls per timing')
+    args = parser.parse_args()
+    args.filler_kb = args.filler_kb or [50, 500]
+
+    # both services ship a top-level async_impl package, only one can be imported per run
+    service_dir, fast_name, soup_name = SERVICES[args.service]
+    sys.path.insert(0, str(service_dir))
+    from async_impl import investing_parser
+    fast, soup = getattr(investing_parser, fast_name), getattr(investing_parser, soup_name)
+
+    results = []
+    for filler_kb in args.filler_kb:
+        page = investing_page_html('/equities/synthetic-00001', filler_kb * 1024 // FILLER_ROW_BYTES).encode()
+        if fast(page) != soup(page):
+            raise RuntimeError(f"Extraction mismatch: {fast(page)} != {soup(page)}")
+
+        fast_time = measure(fast, page, args.number)
+        soup_time = measure(soup, page, max(1, args.number // 10))
+        results.append({
+            'service': args.service,
+            'page_kb': round(len(page) / 1024),
+            'scan_ms': round(fast_time * 1000, 3),
+            'soup_ms': round(soup_time * 1000, 3),
+            'speedup': round(soup_time / fast_time, 1),
+        })
+        logger.info(f"{len(page) / 1024:.0f} KB page: scan {fast_time * 1000:.3f} ms, "
+                    f"BeautifulSoup {soup_time * 1000:.2f} ms ({soup_time / fast_time:.0f}x)")
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
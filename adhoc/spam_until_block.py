@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Sends Investing.com page requests at a fixed rate until the first block signal
+and reports how many requests and how much time it took.
+Run against the local stand-in (adhoc/upstream_stub.py) by setting UPSTREAM_OVERRIDE.
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger(__name__)
+
+
+async def spam(urls: list[str], concurrency: int) -> tuple[int, float]:
+    from parser_service.async_impl import get_stock_id_async, UpstreamBlockedError, close_sessions
+
+    sent = 0
+    blocked = asyncio.Event()
+    started = time.monotonic()
+    source = iter(urls * 1000)
+
+    async def worker():
+        nonlocal sent
+        for url in source:
+            if blocked.is_set():
+                return
+            sent += 1
+            try:
+                await get_stock_id_async(url)
+            except UpstreamBlockedError as e:
+                logger.info(f"Blocked after {sent} requests: {e}")
+                blocked.set()
+            except Exception as e:
+                logger.warning(f"Request failed: {e}")
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        await close_sessions()
+    return sent, time.monotonic() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure how many Investing.com requests pass before a block')
+    parser.add_argument('-u', '--url', action='append', required=True, help='Investing.com page URL (repeatable)')
+    parser.add_argument('-r', '--rate', type=float, default=2.0, help='Requests per second')
+    parser.add_argument('-c', '--concurrency', type=int, default=5)
+    args = parser.parse_args()
+
+    # Fixed rate: disable the AIMD growth and the fleet-wide limiter for the measurement
+    os.environ['INVESTING_RATE_INITIAL'] = str(args.rate)
+    os.environ['INVESTING_RATE_MAX'] = str(args.rate)
+    os.environ['INVESTING_RATE_STEP'] = '0'
+    os.environ['INVESTING_WINDOW_INITIAL'] = str(args.concurrency)
+    os.environ['DISTRIBUTED_LIMITER'] = '0'
+    os.environ['CIRCUIT_BREAKER_THRESHOLD'] = '1000000'
+
+    sent, elapsed = asyncio.run(spam(args.url, args.concurrency))
+    logger.info(f"Sent {sent} requests in {elapsed:.1f}s ({sent / elapsed:.2f} req/s)")
+
+
+if __name__ == '__main__':
+    main()
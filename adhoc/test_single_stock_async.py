@@ -9,7 +9,7 @@ import logging
 import asyncio
 import argparse
 from datetime import datetime
-from parser_service.async_impl import parse_moex_stock_async, get_stock_id_async, get_stock_data_async, get_investing_price_async
+from parser_service.async_impl import parse_moex_stock_async, get_stock_id_async, get_stock_data_async, get_investing_price_async, close_sessions
 
 logging.basicConfig(
     level=logging.INFO,
@@ -52,18 +52,18 @@ async def test_moex(ticker: str, date: str):
         logger.info(f"✓ Found {len(results)} price entries")
         logger.info(f"\nAll available dates:")
         for entry in results[:5]:
-            logger.info(f"  - {entry['date']}: {entry['close_price']} RUB ({entry['short_name']})")
-            logger.info(f"    Trades: {entry.get('num_trades', 'N/A')}, Volume: {entry.get('volume', 'N/A')}")
+            logger.info(f"  - {entry.date}: {entry.close_price} RUB ({entry.short_name})")
+            logger.info(f"    Trades: {entry.num_trades}, Volume: {entry.volume}")
         
         if len(results) > 5:
             logger.info(f"  ... and {len(results) - 5} more")
         
         for entry in results:
-            if entry['date'] == date:
-                logger.info(f"\n✓ Price for {date}: {entry['close_price']} RUB")
-                logger.info(f"  Trades: {entry.get('num_trades', 'N/A')}")
-                logger.info(f"  Volume: {entry.get('volume', 'N/A')}")
-                return entry['close_price']
+            if entry.date == date:
+                logger.info(f"\n✓ Price for {date}: {entry.close_price} RUB")
+                logger.info(f"  Trades: {entry.num_trades}")
+                logger.info(f"  Volume: {entry.volume}")
+                return entry.close_price
         
         logger.warning(f"No price found for specific date: {date}")
         return None
@@ -100,9 +100,9 @@ async def test_investing(url: str, date: str):
         
         for entry in results:
             logger.info(f"\nPrice data:")
-            logger.info(f"  Date: {entry['date']}")
-            logger.info(f"  Close: ${entry['close_price']}")
-            return entry['close_price']
+            logger.info(f"  Date: {entry.date}")
+            logger.info(f"  Close: ${entry.close_price}")
+            return entry.close_price
         
         logger.warning(f"No price found for date: {date}")
         return None
@@ -149,6 +149,7 @@ async def main_async(args):
     
     logger.info(f"{'#'*60}\n")
     
+    await close_sessions()
     return 0 if (moex_price or investing_price) else 1
 
 
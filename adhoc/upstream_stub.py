@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for Investing.com, MOEX ISS and CBR.
+Serves responses shaped like the real ones with configurable latency, error rate and
+a "block after N requests per window" policy, so parser throughput can be measured
+offline. Point the parsers at it with UPSTREAM_OVERRIDE=http://127.0.0.1:8089
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import argparse
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+CURRENCIES = ['USD', 'USD', 'USD', 'EUR', 'GBP', 'CNY']
+# weekdays without MOEX trading, served by the ISS calendar endpoint (month-day)
+MOEX_HOLIDAYS = {'01-01', '01-02', '02-23', '03-08', '05-01', '05-09', '06-12', '11-04', '12-31'}
+CBR_RATES = {'USD': (1, 81.5), 'EUR': (1, 94.2), 'GBP': (1, 109.8), 'CNY': (10, 112.3), 'JPY': (100, 52.4)}
+
+
+@dataclass
+class StubConfig:
+    latency: str = 'fixed'
+    latency_mean: float = 0.05
+    latency_spread: float = 0.02
+    error_rate: float = 0.0
+    block_after: int = 0
+    block_window: float = 60.0
+    block_duration: float = 120.0
+    moex_securities: int = 2000
+    seed: int = 42
+
+
+@dataclass
+class HostState:
+    requests: int = 0
+    errors: int = 0
+    blocked_responses: int = 0
+    blocks: int = 0
+    first_block_after: int | None = None
+    blocked_until: float = 0.0
+    recent: deque = field(default_factory=deque)
+
+
+def synthetic_ticker(i: int) -> str:
+    return f"TCK{i:05d}"
+
+
+def synthetic_investing_url(i: int) -> str:
+    return f"https://ru.investing.com/equities/synthetic-{i:05d}-historical-data"
+
+
+def _digest(*parts) -> int:
+    return int(hashlib.md5(':'.join(str(p) for p in parts).encode()).hexdigest()[:12], 16)
+
+
+def _price(instrument: str, date: str) -> float:
+    return round(10 + _digest(instrument, date) % 100000 / 100, 2)
+
+
+def investing_page_html(slug: str, filler_rows: int = 200) -> str:
+    instrument_id = _digest(slug) % 10_000_000 + 1
+    currency = CURRENCIES[_digest('currency', slug) % len(CURRENCIES)]
+    next_data = {
+        'props': {'pageProps': {'state': {'equityStore': {'instrument': {
+            'base': {'name': slug.rsplit('/', 1)[-1]},
+            'identifiers': {'instrument_id': str(instrument_id), 'ticker': slug[-6:].upper()},
+        }}}}},
+        'page': '/equities/[...equity]',
+    }
+    filler = '<div class="row">' + 'x' * 200 + '</div>'
+    return (
+        '<!DOCTYPE html><html><head><title>Historical data</title></head><body>'
+        + filler * filler_rows
+        + '<div data-test="currency-in-label">Валюта в <span class="font-bold">'
+        + currency + '</span></div>'
+        + '<script id="__NEXT_DATA__" type="application/json">' + json.dumps(next_data) + '</script>'
+        + '</body></html>'
+    )
+
+
+def _is_trading_day(date: str) -> bool:
+    return datetime.strptime(date, '%Y-%m-%d').weekday() < 5 and date[5:] not in MOEX_HOLIDAYS
+
+
+class UpstreamStub:
+    def __init__(self, config: StubConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.hosts: dict[str, HostState] = defaultdict(HostState)
+        self.started = time.monotonic()
+
+    def _latency(self) -> float:
+        c = self.config
+        if c.latency == 'uniform':
+            return self.random.uniform(max(0.0, c.latency_mean - c.latency_spread), c.latency_mean + c.latency_spread)
+        if c.latency == 'normal':
+            return max(0.0, self.random.gauss(c.latency_mean, c.latency_spread))
+        if c.latency == 'lognormal':
+            return self.random.lognormvariate(0, c.latency_spread) * c.latency_mean
+        return c.latency_mean
+
+    def _is_blocked(self, host: str) -> bool:
+        c = self.config
+        state = self.hosts[host]
+        now = time.monotonic()
+
+        state.requests += 1
+        if now < state.blocked_until:
+            return True
+        if not c.block_after:
+            return False
+
+        state.recent.append(now)
+        while state.recent and state.recent[0] < now - c.block_window:
+            state.recent.popleft()
+
+        if len(state.recent) > c.block_after:
+            state.blocked_until = now + c.block_duration
+            state.blocks += 1
+            state.recent.clear()
+            if state.first_block_after is None:
+                state.first_block_after = state.requests
+            logger.warning(f"{host}: blocking for {c.block_duration}s after {state.requests} requests")
+            return True
+        return False
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        if request.path.startswith('/_'):
+            return await handler(request)
+
+        host = request.headers.get('X-Upstream-Host') or self._guess_host(request.path)
+        request['upstream_host'] = host
+        await asyncio.sleep(self._latency())
+
+        if self._is_blocked(host):
+            self.hosts[host].blocked_responses += 1
+            if host == 'api.investing.com':
+                return web.Response(status=429, text="<html><body>Too Many Requests</body></html>",
+                                    content_type='text/html')
+            return web.Response(status=403, text="<html><head><title>Just a moment...</title></head>"
+                                                 "<body>challenge-platform</body></html>",
+                                content_type='text/html')
+
+        if self.random.random() < self.config.error_rate:
+            self.hosts[host].errors += 1
+            return web.Response(status=500, text="Internal Server Error")
+
+        return await handler(request)
+
+    @staticmethod
+    def _guess_host(path: str) -> str:
+        if path.startswith('/iss/'):
+            return 'iss.moex.com'
+        if path.startswith('/scripts/'):
+            return 'cbr.ru'
+        if path.startswith('/api/'):
+            return 'api.investing.com'
+        return 'ru.investing.com'
+
+    async def investing_page(self, request: web.Request) -> web.Response:
+        return web.Response(text=investing_page_html(request.path.rstrip('/')), content_type='text/html')
+
+    async def investing_history(self, request: web.Request) -> web.Response:
+        instrument_id = request.match_info['instrument_id']
+        start = request.query.get('start-date')
+        end = request.query.get('end-date', start)
+
+        rows = []
+        date = datetime.strptime(start, '%Y-%m-%d')
+        while date <= datetime.strptime(end, '%Y-%m-%d'):
+            day = date.strftime('%Y-%m-%d')
+            if _is_trading_day(day):
+                price = _price(instrument_id, day)
+                rows.append({
+                    'rowDate': date.strftime('%d.%m.%Y'),
+                    'rowDateTimestamp': date.strftime('%Y-%m-%dT00:00:00Z'),
+                    'last_close': f"{price:.2f}".replace('.', ','),
+                    'last_closeRaw': price,
+                    'volume': str(_digest('vol', instrument_id, day) % 100000),
+                })
+            date += timedelta(days=1)
+        return web.json_response({'data': rows})
+
+    def _moex_row(self, secid: str, date: str) -> dict:
+        return {
+            'BOARDID': 'OTCB', 'TRADEDATE': date, 'SHORTNAME': secid.split('-')[0],
+            'SECID': secid, 'NUMTRADES': _digest('trades', secid, date) % 500,
+            'VALUE': _digest('value', secid, date) % 10_000_000 / 10, 'CLOSE': _price(secid, date),
+        }
+
+    async def moex_ticker_history(self, request: web.Request) -> web.Response:
+        secid = request.match_info['secid']
+        start = datetime.strptime(request.query['from'], '%Y-%m-%d')
+        till = datetime.strptime(request.query['till'], '%Y-%m-%d')
+
+        rows = []
+        date = till
+        while date >= start and len(rows) < int(request.query.get('limit', 20)):
+            day = date.strftime('%Y-%m-%d')
+            if _is_trading_day(day):
+                rows.append(self._moex_row(secid, day))
+            date -= timedelta(days=1)
+
+        if request.query.get('iss.json') == 'extended':
+            body = json.dumps([{'charsetinfo': {'name': 'utf-8'}}, {'history': rows}], ensure_ascii=False)
+        else:
+            columns = list(rows[0]) if rows else list(self._moex_row(secid, '2000-01-01'))
+            body = json.dumps({'history': {'columns': columns, 'data': [list(r.values()) for r in rows]}})
+
+        callback = request.query.get('callback')
+        if request.path.endswith('.jsonp') and callback:
+            return web.Response(text=f"{callback}({body})", content_type='application/javascript')
+        return web.Response(text=body, content_type='application/json')
+
+    async def moex_board_history(self, request: web.Request) -> web.Response:
+        date = request.query['date']
+        start = int(request.query.get('start', 0))
+        limit = min(int(request.query.get('limit', 100)), 100)
+
+        total = self.config.moex_securities if _is_trading_day(date) else 0
+        rows = [self._moex_row(f"{synthetic_ticker(i)}-RM", date) for i in range(start, min(start + limit, total))]
+        columns = list(self._moex_row('X-RM', date))
+        return web.json_response({
+            'history': {'columns': columns, 'data': [list(r.values()) for r in rows]},
+            'history.cursor': {'columns': ['INDEX', 'TOTAL', 'PAGESIZE'], 'data': [[start, total, limit]]},
+        })
+
+    async def moex_calendar(self, request: web.Request) -> web.Response:
+        # only the days that break the Mon-Fri rule, like ISS without show_all_days
+        start = datetime.strptime(request.query['from'], '%Y-%m-%d')
+        till = datetime.strptime(request.query['till'], '%Y-%m-%d')
+        off_days = []
+        day = start
+        while day <= till:
+            date = day.strftime('%Y-%m-%d')
+            if day.weekday() < 5 and not _is_trading_day(date):
+                off_days.append([date, 0, 'holiday'])
+            day += timedelta(days=1)
+        return web.json_response({'off_days': {'columns': ['tradedate', 'is_traded', 'reason'], 'data': off_days}})
+
+    async def cbr_daily(self, request: web.Request) -> web.Response:
+        date = request.query.get('date_req', datetime.now().strftime('%d/%m/%Y'))
+        valutes = ''.join(
+            f'<Valute ID="R{i:05d}"><NumCode>{i:03d}</NumCode><CharCode>{code}</CharCode>'
+            f'<Nominal>{nominal}</Nominal><Name>{code}</Name><Value>{f"{value:.4f}".replace(".", ",")}</Value>'
+            f'<VunitRate>{f"{value / nominal:.4f}".replace(".", ",")}</VunitRate></Valute>'
+            for i, (code, (nominal, value)) in enumerate(CBR_RATES.items())
+        )
+        xml = f'<?xml version="1.0" encoding="utf-8"?><ValCurs Date="{date.replace("/", ".")}" name="Foreign Currency Market">{valutes}</ValCurs>'
+        return web.Response(body=xml.encode('utf-8'), content_type='application/xml')
+
+    async def stats(self, request: web.Request) -> web.Response:
+        elapsed = time.monotonic() - self.started
+        return web.json_response({
+            'elapsed': round(elapsed, 3),
+            'hosts': {
+                host: {
+                    'requests': s.requests,
+                    'errors': s.errors,
+                    'blocked_responses': s.blocked_responses,
+                    'blocks': s.blocks,
+                    'first_block_after': s.first_block_after,
+                    'requests_per_second': round(s.requests / elapsed, 3) if elapsed else 0,
+                }
+                for host, s in self.hosts.items()
+            },
+        })
+
+    async def reset(self, request: web.Request) -> web.Response:
+        self.hosts.clear()
+        self.started = time.monotonic()
+        return web.json_response({'status': 'ok'})
+
+
+def create_app(config: StubConfig) -> web.Application:
+    stub = UpstreamStub(config)
+    app = web.Application(middlewares=[stub.middleware])
+    app.router.add_get('/_stats', stub.stats)
+    app.router.add_post('/_reset', stub.reset)
+    app.router.add_get('/api/financialdata/historical/{instrument_id}', stub.investing_history)
+    app.router.add_get('/iss/history/engines/otc/markets/shares/boardgroups/1258/securities.json', stub.moex_board_history)
+    app.router.add_get('/iss/history/engines/otc/markets/shares/boardgroups/1258/securities/{secid}.{ext}',
+                       stub.moex_ticker_history)
+    app.router.add_get('/iss/calendars.json', stub.moex_calendar)
+    app.router.add_get('/scripts/XML_daily.asp', stub.cbr_daily)
+    app.router.add_get('/{tail:.*}', stub.investing_page)
+    return app
+
+
+def main():
+    # configured here, not on import: the benchmarks import the stub and keep stdout for their JSON
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    parser = argparse.ArgumentParser(description='Local stand-in for Investing.com, MOEX ISS and CBR')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', choices=['fixed', 'uniform', 'normal', 'lognormal'], default='fixed',
+                        help='Latency distribution')
+    parser.add_argument('--latency-mean', type=float, default=0.05, help='Mean latency, seconds')
+    parser.add_argument('--latency-spread', type=float, default=0.02,
+                        help='Half-width (uniform), stddev (normal) or sigma (lognormal)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with HTTP 500')
+    parser.add_argument('--block-after', type=int, default=0,
+                        help='Block a host after N requests per window (0 - never)')
+    parser.add_argument('--block-window', type=float, default=60.0, help='Window for --block-after, seconds')
+    parser.add_argument('--block-duration', type=float, default=120.0, help='How long a block lasts, seconds')
+    parser.add_argument('--moex-securities', type=int, default=2000,
+                        help='Size of the synthetic MOEX board group (tickers TCK00000...)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency=args.latency,
+        latency_mean=args.latency_mean,
+        latency_spread=args.latency_spread,
+        error_rate=args.error_rate,
+        block_after=args.block_after,
+        block_window=args.block_window,
+        block_duration=args.block_duration,
+        moex_securities=args.moex_securities,
+        seed=args.seed,
+    )
+    logger.info(f"Upstream stub listening on http://{args.host}:{args.port} ({config})")
+    web.run_app(create_app(config), host=args.host, port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()
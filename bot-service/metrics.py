@@ -0,0 +1,74 @@
+import os
+import time
+import asyncio
+import logging
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+logger = logging.getLogger(__name__)
+
+# Prometheus metrics of the bot served over HTTP on METRICS_PORT (0 - disabled)
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9100))
+QUEUE_METRICS_INTERVAL = float(os.getenv('QUEUE_METRICS_INTERVAL', 15))
+LOOP_LAG_INTERVAL = 0.5
+
+JOBS_SUBMITTED = Counter('bot_jobs_submitted_total', 'Jobs queued for the parser', ['mode'])
+RESULTS = Counter('bot_results_total', 'Job results delivered to users', ['status'])
+RESULT_DELIVERY = Histogram(
+    'bot_result_delivery_seconds', 'Time to send a result to Telegram',
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30))
+QUEUE_LENGTH = Gauge('bot_queue_length', 'Entries kept in the stream', ['stream'])
+QUEUE_LAG = Gauge('bot_queue_lag', 'Entries not yet delivered to the consumer group', ['stream', 'group'])
+QUEUE_PENDING = Gauge('bot_queue_pending', 'Delivered but unacknowledged entries', ['stream', 'group'])
+QUEUE_WAIT = Gauge(
+    'bot_queue_wait_seconds', 'Age of the oldest entry not yet delivered to the consumer group',
+    ['stream', 'group'])
+LOOP_LAG = Histogram(
+    'bot_event_loop_lag_seconds', 'Delay of event loop callbacks beyond their schedule',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+LOOP_STALLS = Histogram(
+    'bot_event_loop_stall_seconds', 'Event loop blocked past the watchdog threshold, by the blocking code',
+    ['site'], buckets=(0.5, 1, 2, 5, 10, 30, 60, 120))
+
+
+def start_metrics_server():
+    if METRICS_PORT <= 0:
+        return
+    start_http_server(METRICS_PORT)
+    logger.info(f"Metrics available on :{METRICS_PORT}/metrics")
+
+
+async def _collect_queue(r, stream: str, group: str | None):
+    QUEUE_LENGTH.labels(stream).set(await r.xlen(stream))
+    for info in await r.xinfo_groups(stream):
+        if group is not None and info['name'] != group:
+            continue
+        QUEUE_PENDING.labels(stream, info['name']).set(info['pending'])
+        if info.get('lag') is not None:
+            QUEUE_LAG.labels(stream, info['name']).set(info['lag'])
+
+        undelivered = await r.xrange(stream, min=f"({info['last-delivered-id']}", count=1)
+        age = (time.time() * 1000 - int(undelivered[0][0].split('-')[0])) / 1000 if undelivered else 0
+        QUEUE_WAIT.labels(stream, info['name']).set(max(0.0, age))
+
+
+async def monitor_queues(r, queues: list[tuple[str, str | None]]):
+    # queues are (stream, consumer group) pairs, None reports every group of the stream
+    while True:
+        for stream, group in queues:
+            try:
+                await _collect_queue(r, stream, group)
+            except Exception as e:
+                logger.debug(f"Queue metrics for {stream} unavailable: {e}")
+        await asyncio.sleep(QUEUE_METRICS_INTERVAL)
+
+
+async def monitor_loop_lag():
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        LOOP_LAG.observe(max(0.0, loop.time() - started - LOOP_LAG_INTERVAL))
+
+
+def record_loop_stall(seconds: float, site: str):
+    LOOP_STALLS.labels(site).observe(seconds)
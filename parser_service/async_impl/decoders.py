@@ -0,0 +1,82 @@
+import json
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Response decoders run in the CPU executor: they take the raw body, decode it with orjson
+# when installed and return slotted records instead of a dict per row
+ISS_HISTORY_COLUMNS = ('SECID', 'SHORTNAME', 'CLOSE', 'TRADEDATE', 'NUMTRADES', 'VALUE')
+
+
+@dataclass(slots=True)
+class MoexRecord:
+    short_name: str | None
+    close_price: float | None
+    date: str
+    num_trades: int | None
+    volume: float | None
+
+
+@dataclass(slots=True)
+class PriceRecord:
+    date: str
+    close_price: float | str | None
+
+
+def loads(data: bytes | str):
+    # orjson.JSONDecodeError is a ValueError like json's
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def decode_iss_history(data: bytes) -> tuple[list[tuple[str, MoexRecord]], tuple[int, int] | None]:
+    # Compact ISS JSON ({"history": {"columns": [...], "data": [[...], ...]}}): columns are looked up
+    # once and rows read by index. Returns (SECID, record) pairs and (total, page size) of history.cursor
+    tables = loads(data)
+    history = tables["history"]
+    index = {name: i for i, name in enumerate(history["columns"])}
+    secid, short_name, close, trade_date, num_trades, value = (index[name] for name in ISS_HISTORY_COLUMNS)
+    records = [
+        (row[secid], MoexRecord(row[short_name], row[close], row[trade_date], row[num_trades], row[value]))
+        for row in history["data"]
+    ]
+
+    cursor = tables.get("history.cursor")
+    if cursor is None or not cursor["data"]:
+        return records, None
+    cursor_row = cursor["data"][0]
+    return records, (cursor_row[cursor["columns"].index("TOTAL")], cursor_row[cursor["columns"].index("PAGESIZE")])
+
+
+def investing_history_records(payload) -> list[PriceRecord]:
+    data = payload.get('data', []) if isinstance(payload, dict) else payload
+    if data is None:
+        # {"data": null} is the API's answer for a day without trading, not a failed request
+        return []
+    if not isinstance(data, (list, tuple)):
+        raise ValueError(f"Data is not iterable: {data}")
+    return [PriceRecord(row['rowDate'], row['last_close']) for row in data]
+
+
+def decode_cbr_rates(content: bytes) -> dict[str, float]:
+    # XML_daily.asp in one pass: currency code -> roubles per one unit (Value / Nominal)
+    rates = {}
+    for valute in ET.fromstring(content).iter('Valute'):
+        code = valute.findtext('CharCode')
+        value = valute.findtext('Value')
+        if not code or not value:
+            continue
+        nominal = valute.findtext('Nominal')
+        rates[code] = float(value.replace(',', '.')) / (int(nominal) if nominal else 1)
+    return rates
+
+
+def decode_iss_off_days(data: bytes) -> dict[str, bool]:
+    # /iss/calendars off_days: dates that differ from the Mon-Fri rule, tradedate -> traded
+    table = loads(data)["off_days"]
+    index = {name.lower(): i for i, name in enumerate(table["columns"])}
+    trade_date, traded = index["tradedate"], index["is_traded"]
+    return {row[trade_date]: bool(int(row[traded])) for row in table["data"]}
@@ -0,0 +1,121 @@
+import os
+import asyncio
+import logging
+import multiprocessing
+from functools import partial
+from itertools import islice
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .profiling import profiling_active, tag_pool_call
+
+logger = logging.getLogger(__name__)
+
+# CPU-heavy steps (HTML, JSON and XML parsing, workbook reads and writes) go through run_cpu:
+# 'inline' runs them on the event loop, 'thread' hands them to a thread pool so the loop keeps
+# serving sockets between GIL switches, 'process' runs them in worker processes off the GIL
+# at the cost of pickling the arguments and the result
+CPU_EXECUTOR = os.getenv('CPU_EXECUTOR', 'thread')
+CPU_EXECUTOR_WORKERS = int(os.getenv('CPU_EXECUTOR_WORKERS', 0)) or min(4, os.cpu_count() or 1)
+# Smaller payloads are parsed inline, handing them off costs more than the parse itself
+CPU_INLINE_BYTES = int(os.getenv('CPU_INLINE_BYTES', 16 * 1024))
+# Items pulled from a lazy iterator per hand-off to the thread pool
+CPU_ITER_CHUNK = int(os.getenv('CPU_ITER_CHUNK', 500))
+USE_UVLOOP = os.getenv('USE_UVLOOP', '0') == '1'
+
+_executor: Executor | None = None
+_profiled_threads: Executor | None = None
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if CPU_EXECUTOR == 'process':
+            # spawn: forking a process that already runs an event loop and HTTP sessions is unsafe
+            _executor = ProcessPoolExecutor(CPU_EXECUTOR_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        else:
+            _executor = ThreadPoolExecutor(CPU_EXECUTOR_WORKERS, thread_name_prefix='cpu')
+        logger.info(f"CPU executor: {CPU_EXECUTOR} pool with {CPU_EXECUTOR_WORKERS} workers")
+    return _executor
+
+
+def _get_profiled_executor() -> Executor:
+    # The sampling profiler can't look into worker processes, so with 'process' a profiled
+    # job's work goes to threads of its own; other jobs keep using the process pool
+    global _profiled_threads
+    if CPU_EXECUTOR == 'thread':
+        return _get_executor()
+    if _profiled_threads is None:
+        _profiled_threads = ThreadPoolExecutor(CPU_EXECUTOR_WORKERS, thread_name_prefix='cpu-profiled')
+    return _profiled_threads
+
+
+async def run_cpu(func, *args, size: int | None = None, **kwargs):
+    # func and its arguments must be picklable (module-level functions) for the process pool
+    if CPU_EXECUTOR not in ('thread', 'process') or (size is not None and size < CPU_INLINE_BYTES):
+        return func(*args, **kwargs)
+
+    global _executor
+    call = partial(func, *args, **kwargs) if kwargs else partial(func, *args)
+    if profiling_active():
+        return await asyncio.get_running_loop().run_in_executor(_get_profiled_executor(), tag_pool_call(call))
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), call)
+    except BrokenProcessPool:
+        # a crashed worker process breaks the whole pool, the next call starts a fresh one
+        logger.error("CPU process pool is broken, restarting it")
+        _executor = None
+        raise
+
+
+def _take(iterator, count: int) -> list:
+    return list(islice(iterator, count))
+
+
+async def iter_cpu(iterator, chunk_size: int = CPU_ITER_CHUNK):
+    # Pulls a lazy iterator (workbook rows) in chunks, so only one chunk is held at a time.
+    # Generators can't be pickled: with 'process' and 'inline' the chunks are pulled on the loop,
+    # which gets a turn between them
+    threaded = CPU_EXECUTOR == 'thread'
+    try:
+        while True:
+            if threaded:
+                chunk = await asyncio.get_running_loop().run_in_executor(
+                    _get_executor(), tag_pool_call(partial(_take, iterator, chunk_size)))
+            else:
+                chunk = _take(iterator, chunk_size)
+                await asyncio.sleep(0)
+            if not chunk:
+                return
+            for item in chunk:
+                yield item
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            try:
+                close()
+            except ValueError:
+                # cancelled while a chunk was still being pulled in the pool, it is closed when collected
+                pass
+
+
+def close_executor():
+    global _executor, _profiled_threads
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    if _profiled_threads is not None:
+        _profiled_threads.shutdown(wait=False, cancel_futures=True)
+        _profiled_threads = None
+
+
+def run_event_loop(main):
+    if USE_UVLOOP:
+        try:
+            import uvloop
+        except ImportError:
+            logger.warning("USE_UVLOOP=1 but uvloop is not installed, using the default event loop")
+        else:
+            logger.info("Running on uvloop")
+            return uvloop.run(main)
+    return asyncio.run(main)
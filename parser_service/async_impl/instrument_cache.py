@@ -0,0 +1,84 @@
+import os
+import json
+import logging
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+INSTRUMENT_CACHE_SIZE = int(os.getenv('INSTRUMENT_CACHE_SIZE', 4096))
+# 0 disables expiry: instrument ids of Investing.com pages never change
+INSTRUMENT_CACHE_TTL = int(os.getenv('INSTRUMENT_CACHE_TTL', 90 * 24 * 3600))
+INSTRUMENT_CACHE_REFRESH = os.getenv('INSTRUMENT_CACHE_REFRESH', '0') == '1'
+
+_redis = None
+_key_prefix = 'investing:instrument'
+_local: OrderedDict[str, dict] = OrderedDict()
+
+
+def configure_instrument_cache(redis_client, key_prefix: str):
+    global _redis, _key_prefix
+    _redis = redis_client
+    _key_prefix = key_prefix
+
+
+def canonicalize_url(url: str) -> str:
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.endswith(':443'):
+        host = host[:-4]
+    path = parts.path.rstrip('/') or '/'
+    # the query stays in the key: ?cid= picks the listing of an equity traded on several exchanges
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit(('https', host, path, query, ''))
+
+
+def _remember(key: str, entry: dict):
+    _local[key] = entry
+    _local.move_to_end(key)
+    while len(_local) > INSTRUMENT_CACHE_SIZE:
+        _local.popitem(last=False)
+
+
+async def get_cached_instrument(url: str) -> dict | None:
+    key = canonicalize_url(url)
+
+    entry = _local.get(key)
+    if entry is not None:
+        _local.move_to_end(key)
+        record_cache('instrument_local', True)
+        return entry
+
+    if _redis is None:
+        record_cache('instrument_local', False)
+        return None
+
+    try:
+        raw = await _redis.get(f"{_key_prefix}:{key}")
+    except Exception as e:
+        logger.warning(f"Instrument cache read failed: {e}")
+        return None
+
+    record_cache('instrument', raw is not None)
+    if raw is None:
+        return None
+
+    entry = json.loads(raw)
+    _remember(key, entry)
+    return entry
+
+
+async def store_instrument(url: str, entry: dict):
+    key = canonicalize_url(url)
+    _remember(key, entry)
+
+    if _redis is None:
+        return
+
+    try:
+        await _redis.set(f"{_key_prefix}:{key}", json.dumps(entry), ex=INSTRUMENT_CACHE_TTL or None)
+    except Exception as e:
+        logger.warning(f"Instrument cache write failed: {e}")
+
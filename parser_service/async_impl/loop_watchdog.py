@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+import signal
+import asyncio
+import logging
+import sysconfig
+import threading
+import traceback
+
+logger = logging.getLogger(__name__)
+
+# A thread watches a heartbeat the event loop bumps every LOOP_WATCHDOG_INTERVAL. When the loop
+# misses it for LOOP_STALL_THRESHOLD seconds the loop thread's stack is captured while it is still
+# blocked, so the log names the code that froze the loop rather than only the lag it caused.
+# SIGUSR2 turns the watchdog on and off at runtime
+LOOP_WATCHDOG = os.getenv('LOOP_WATCHDOG', '1') == '1'
+LOOP_STALL_THRESHOLD = float(os.getenv('LOOP_STALL_THRESHOLD', 0.5))
+LOOP_WATCHDOG_INTERVAL = 0.1
+LOOP_STALL_STACK_DEPTH = 15
+
+_LIBRARY_PATHS = tuple({sysconfig.get_paths()[name] for name in ('stdlib', 'platstdlib', 'purelib', 'platlib')})
+
+
+def _blocking_site(stack: traceback.StackSummary) -> str:
+    # innermost frame of our own code, library internals say little about who blocked
+    for frame in reversed(stack):
+        if not frame.filename.startswith(_LIBRARY_PATHS):
+            return f"{frame.name} ({os.path.basename(frame.filename)})"
+    return f"{stack[-1].name} ({os.path.basename(stack[-1].filename)})" if stack else 'unknown'
+
+
+class LoopWatchdog:
+    def __init__(self, on_stall=None):
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        # on_stall(seconds, site) exports the stall, e.g. to Prometheus
+        self.on_stall = on_stall
+        self.enabled = LOOP_WATCHDOG
+        self.last_beat = time.monotonic()
+        # (heartbeat the stall started after, task name, site, formatted stack)
+        self._stall: tuple[float, str, str, str] | None = None
+        self._thread = threading.Thread(target=self._run, name='loop-watchdog', daemon=True)
+
+    def start(self):
+        self.loop.call_soon(self._beat)
+        self._thread.start()
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self._stall = None
+        logger.info(f"Event loop watchdog {'enabled' if self.enabled else 'disabled'} "
+                    f"(threshold {LOOP_STALL_THRESHOLD}s)")
+
+    def _beat(self):
+        self.last_beat = time.monotonic()
+        self.loop.call_later(LOOP_WATCHDOG_INTERVAL, self._beat)
+
+    def _capture(self, beat: float) -> tuple[float, str, str, str] | None:
+        frame = sys._current_frames().get(self.loop_thread)
+        if frame is None:
+            return None
+        task = asyncio.current_task(self.loop)
+        stack = traceback.extract_stack(frame, limit=LOOP_STALL_STACK_DEPTH)
+        formatted = '\n'.join(f"    {os.path.basename(entry.filename)}:{entry.lineno} {entry.name}"
+                              for entry in stack)
+        return beat, task.get_name() if task is not None else 'callback', _blocking_site(stack), formatted
+
+    def _report(self, seconds: float):
+        _, task_name, site, stack = self._stall
+        logger.warning(f"Event loop blocked for {seconds:.2f}s by {site} in task {task_name}:\n{stack}")
+        if self.on_stall is not None:
+            self.on_stall(seconds, site)
+
+    def _run(self):
+        while not self.loop.is_closed():
+            time.sleep(LOOP_WATCHDOG_INTERVAL / 2)
+            if not self.enabled:
+                continue
+
+            beat = self.last_beat
+            if self._stall is None:
+                if time.monotonic() - beat - LOOP_WATCHDOG_INTERVAL >= LOOP_STALL_THRESHOLD:
+                    self._stall = self._capture(beat)
+            elif beat != self._stall[0]:
+                # the loop is running again; the new heartbeat marks when it got free
+                self._report(max(0.0, beat - self._stall[0] - LOOP_WATCHDOG_INTERVAL))
+                self._stall = None
+
+
+def start_loop_watchdog(on_stall=None) -> LoopWatchdog:
+    watchdog = LoopWatchdog(on_stall)
+    watchdog.start()
+    try:
+        watchdog.loop.add_signal_handler(signal.SIGUSR2, watchdog.toggle)
+    except (NotImplementedError, RuntimeError, AttributeError):
+        logger.debug("SIGUSR2 is not available, the loop watchdog can only be set with LOOP_WATCHDOG")
+    return watchdog
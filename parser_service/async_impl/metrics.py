@@ -0,0 +1,146 @@
+import os
+import time
+import asyncio
+import logging
+from urllib.parse import urlsplit
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+from .rate_limiter import THROTTLE_STATUSES
+from .job_stats import count
+
+logger = logging.getLogger(__name__)
+
+# Prometheus metrics served over HTTP on METRICS_PORT (0 - disabled); the per-job
+# events are also counted in the JobStats of the running job for its report
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9100))
+QUEUE_METRICS_INTERVAL = float(os.getenv('QUEUE_METRICS_INTERVAL', 15))
+LOOP_LAG_INTERVAL = 0.5
+
+UPSTREAM_REQUESTS = Counter(
+    'parser_upstream_requests_total',
+    'Upstream HTTP requests by host and outcome: status class, throttle status or error', ['host', 'outcome'])
+UPSTREAM_LATENCY = Histogram(
+    'parser_upstream_request_seconds', 'Upstream HTTP request latency, limiter waits excluded', ['host'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32))
+UPSTREAM_RETRIES = Counter(
+    'parser_upstream_retries_total', 'Upstream calls retried after an error', ['host'])
+UPSTREAM_RETRY_DELAY = Counter(
+    'parser_upstream_retry_delay_seconds_total', 'Time slept before upstream retries', ['host'])
+UPSTREAM_BLOCKS = Counter(
+    'parser_upstream_blocks_total', 'Block signals that made the rate limiter back off', ['host'])
+ROWS = Counter('parser_rows_total', 'Processed workbook rows', ['mode', 'outcome'])
+JOB_ROWS_PER_SECOND = Gauge('parser_job_rows_per_second', 'Rows per second of the last finished job', ['mode'])
+JOB_DURATION = Histogram(
+    'parser_job_duration_seconds', 'Job duration', ['mode', 'status'],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200))
+CACHE_LOOKUPS = Counter('parser_cache_lookups_total', 'Cache lookups', ['cache', 'result'])
+QUEUE_LENGTH = Gauge('parser_queue_length', 'Entries kept in the stream', ['stream'])
+QUEUE_LAG = Gauge('parser_queue_lag', 'Entries not yet delivered to the consumer group', ['stream', 'group'])
+QUEUE_PENDING = Gauge('parser_queue_pending', 'Delivered but unacknowledged entries', ['stream', 'group'])
+QUEUE_WAIT = Gauge(
+    'parser_queue_wait_seconds', 'Age of the oldest entry not yet delivered to the consumer group',
+    ['stream', 'group'])
+QUEUE_OLDEST_PENDING = Gauge(
+    'parser_queue_oldest_pending_seconds', 'Age of the oldest unacknowledged entry', ['stream', 'group'])
+LOOP_LAG = Histogram(
+    'parser_event_loop_lag_seconds', 'Delay of event loop callbacks beyond their schedule',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+LOOP_STALLS = Histogram(
+    'parser_event_loop_stall_seconds', 'Event loop blocked past the watchdog threshold, by the blocking code',
+    ['site'], buckets=(0.5, 1, 2, 5, 10, 30, 60, 120))
+
+
+def start_metrics_server():
+    if METRICS_PORT <= 0:
+        return
+    start_http_server(METRICS_PORT)
+    logger.info(f"Metrics available on :{METRICS_PORT}/metrics")
+
+
+def observe_request(host: str, seconds: float, status_code: int | None = None):
+    if status_code is None:
+        outcome = 'error'
+    elif status_code in THROTTLE_STATUSES:
+        outcome = str(status_code)
+    else:
+        outcome = f"{status_code // 100}xx"
+    UPSTREAM_REQUESTS.labels(host, outcome).inc()
+    UPSTREAM_LATENCY.labels(host).observe(seconds)
+    count('requests', host)
+    if outcome != '2xx':
+        count('failed_requests', f"{host} {outcome}")
+
+
+def record_retry(url: str, delay: float = 0.0):
+    host = urlsplit(url).hostname or url
+    UPSTREAM_RETRIES.labels(host).inc()
+    UPSTREAM_RETRY_DELAY.labels(host).inc(delay)
+    count('retries', host)
+
+
+def record_block(host: str):
+    UPSTREAM_BLOCKS.labels(host).inc()
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_LOOKUPS.labels(cache, 'hit' if hit else 'miss').inc()
+    count('cache_hits' if hit else 'cache_misses', cache)
+
+
+def record_row(mode: str, failed: bool):
+    ROWS.labels(mode, 'failed' if failed else 'done').inc()
+
+
+def observe_job(mode: str, status: str, seconds: float):
+    JOB_DURATION.labels(mode, status).observe(seconds)
+
+
+def observe_fetch_rate(mode: str, rows: int, seconds: float):
+    if rows and seconds > 0:
+        JOB_ROWS_PER_SECOND.labels(mode).set(rows / seconds)
+
+
+def _entry_age(entry_id: str, now_ms: int) -> float:
+    return max(0.0, (now_ms - int(entry_id.split('-')[0])) / 1000)
+
+
+async def _collect_queue(r, stream: str, group: str):
+    QUEUE_LENGTH.labels(stream).set(await r.xlen(stream))
+    for info in await r.xinfo_groups(stream):
+        if info['name'] != group:
+            continue
+        now_ms = int(time.time() * 1000)
+        QUEUE_PENDING.labels(stream, group).set(info['pending'])
+        # lag is reported by Redis 7+, None when it cannot be computed after trimming
+        if info.get('lag') is not None:
+            QUEUE_LAG.labels(stream, group).set(info['lag'])
+
+        undelivered = await r.xrange(stream, min=f"({info['last-delivered-id']}", count=1)
+        QUEUE_WAIT.labels(stream, group).set(_entry_age(undelivered[0][0], now_ms) if undelivered else 0)
+
+        summary = await r.xpending(stream, group)
+        QUEUE_OLDEST_PENDING.labels(stream, group).set(
+            _entry_age(summary['min'], now_ms) if summary['pending'] else 0)
+
+
+async def monitor_queues(r, queues: list[tuple[str, str]]):
+    # queues are (stream, consumer group) pairs; every replica reports the same values
+    while True:
+        for stream, group in queues:
+            try:
+                await _collect_queue(r, stream, group)
+            except Exception as e:
+                logger.debug(f"Queue metrics for {stream} unavailable: {e}")
+        await asyncio.sleep(QUEUE_METRICS_INTERVAL)
+
+
+async def monitor_loop_lag():
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        LOOP_LAG.observe(max(0.0, loop.time() - started - LOOP_LAG_INTERVAL))
+
+
+def record_loop_stall(seconds: float, site: str):
+    LOOP_STALLS.labels(site).observe(seconds)
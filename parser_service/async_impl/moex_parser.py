@@ -1,59 +1,69 @@
-import json
 import asyncio
 import logging
 from datetime import datetime, timedelta
-from curl_cffi.requests import AsyncSession
+
+from .sessions import http_get
+from .metrics import record_retry
+from .executor import run_cpu
+from .decoders import MoexRecord, decode_iss_history, ISS_HISTORY_COLUMNS
 
 logger = logging.getLogger(__name__)
 
+MOEX_BOARD_GROUP_URL = "https://iss.moex.com/iss/history/engines/otc/markets/shares/boardgroups/1258/securities"
+MOEX_PAGE_SIZE = 100
+# compact JSON with only the history columns we read
+ISS_HISTORY_QUERY = f"iss.meta=off&lang=ru&history.columns={','.join(ISS_HISTORY_COLUMNS)}"
+MOEX_COOKIES = {"bh": "Ek8iTm90KUE7QnJhbmQiO3Y9IjgiLCAiQ2hyb21pdW0iO3Y9IjEzOCIsICJZYUJyb3dzZXIiO3Y9IjI1LjgiLCAiWW93c2VyIjt2PSIyLjUiGgUiYXJtIioCPzA6ByJtYWNPUyJCCCIxNS42LjAiSgQiNjQiUmYiTm90KUE7QnJhbmQiO3Y9IjguMC4wLjAiLCAiQ2hyb21pdW0iO3Y9IjEzOC4wLjcyMDQuOTc3IiwgIllhQnJvd3NlciI7dj0iMjUuOC41Ljk3NyIsICJZb3dzZXIiO3Y9IjIuNSJaAj8wYOvS3MkGaiPcytG2Abvxn6sE"}
+
 
-async def parse_moex_stock_async(ticker: str, target_date: str) -> list[dict]:
+async def parse_moex_stock_async(ticker: str, target_date: str) -> list[MoexRecord]:
     date_obj = datetime.strptime(target_date, '%Y-%m-%d')
     from_date = (date_obj - timedelta(days=30)).strftime('%Y-%m-%d')
     till_date = (date_obj + timedelta(days=1)).strftime('%Y-%m-%d')
     
-    url = f"https://iss.moex.com/iss/history/engines/otc/markets/shares/boardgroups/1258/securities/{ticker}-RM.jsonp?iss.meta=off&iss.json=extended&callback=JSON_CALLBACK&lang=ru&from={from_date}&till={till_date}&start=0&limit=20&sort_column=TRADEDATE&sort_order=desc"
+    url = f"{MOEX_BOARD_GROUP_URL}/{ticker}-RM.json?{ISS_HISTORY_QUERY}&iss.only=history&from={from_date}&till={till_date}&start=0&limit=20&sort_column=TRADEDATE&sort_order=desc"
+
+    records, _ = await _get_iss_history(url)
+    return [record for _, record in records]
+
 
+async def _get_iss_history(url: str) -> tuple[list[tuple[str, MoexRecord]], tuple[int, int] | None]:
     max_retries = 5
     retry_delays = [2, 4, 8, 16, 32]
-    
+
     for attempt in range(max_retries):
         try:
-            async with AsyncSession() as client:
-                response = await client.get(
-                    url, 
-                    timeout=30, 
-                    impersonate="chrome120", 
-                    cookies={"bh": "Ek8iTm90KUE7QnJhbmQiO3Y9IjgiLCAiQ2hyb21pdW0iO3Y9IjEzOCIsICJZYUJyb3dzZXIiO3Y9IjI1LjgiLCAiWW93c2VyIjt2PSIyLjUiGgUiYXJtIioCPzA6ByJtYWNPUyJCCCIxNS42LjAiSgQiNjQiUmYiTm90KUE7QnJhbmQiO3Y9IjguMC4wLjAiLCAiQ2hyb21pdW0iO3Y9IjEzOC4wLjcyMDQuOTc3IiwgIllhQnJvd3NlciI7dj0iMjUuOC41Ljk3NyIsICJZb3dzZXIiO3Y9IjIuNSJaAj8wYOvS3MkGaiPcytG2Abvxn6sE"}
-                )
-                response.raise_for_status()
-
-                data = response.text.split("(")[1].split(")")[0]
-                data = json.loads(data)[1]
-
-                results = []
-                history = data["history"]
-                for row in history:
-                    short_name = row["SHORTNAME"]
-                    close_price = row["CLOSE"]
-                    trade_date = row["TRADEDATE"]
-                    num_trades = row["NUMTRADES"]
-                    volume = row["VALUE"]
-                    results.append({
-                        'short_name': short_name,
-                        'close_price': close_price,
-                        'date': trade_date,
-                        'num_trades': num_trades,
-                        'volume': volume
-                    })
-                
-                return results
-                
+            response = await http_get(url, timeout=30, impersonate="chrome120", cookies=MOEX_COOKIES)
+            response.raise_for_status()
+            return await run_cpu(decode_iss_history, response.content, size=len(response.content))
+
         except Exception as e:
             if attempt < max_retries - 1:
                 delay = retry_delays[attempt]
-                logger.warning(f"MOEX parser error (attempt {attempt + 1}/{max_retries}): {e}. Retrying in {delay}s...")
+                logger.warning(f"MOEX ISS error (attempt {attempt + 1}/{max_retries}): {e}. Retrying in {delay}s...")
+                record_retry(url, delay)
                 await asyncio.sleep(delay)
             else:
-                logger.error(f"MOEX parser failed after {max_retries} attempts: {e}")
+                logger.error(f"MOEX ISS request failed after {max_retries} attempts: {e}")
                 raise
+
+
+async def fetch_moex_board_history_async(target_date: str) -> dict[str, MoexRecord]:
+    # Whole board group history for one date, indexed by SECID ("{ticker}-RM")
+    def page_url(start: int) -> str:
+        return f"{MOEX_BOARD_GROUP_URL}.json?{ISS_HISTORY_QUERY}&iss.only=history,history.cursor&date={target_date}&start={start}&limit={MOEX_PAGE_SIZE}"
+
+    first_page, cursor = await _get_iss_history(page_url(0))
+    total, page_size = cursor or (0, MOEX_PAGE_SIZE)
+
+    index = dict(first_page)
+    pages = await asyncio.gather(*(_get_iss_history(page_url(start)) for start in range(page_size, total, page_size)))
+    for records, _ in pages:
+        index.update(records)
+
+    logger.info(f"MOEX bulk history for {target_date}: {len(index)} securities in {len(pages) + 1} requests")
+    return index
+
+
+def moex_secid(ticker) -> str:
+    return f"{str(ticker).strip().upper()}-RM"
@@ -0,0 +1,62 @@
+import os
+import json
+import logging
+from datetime import datetime, timedelta
+
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+PRICE_CACHE_ENABLED = os.getenv('PRICE_CACHE', '1') == '1'
+# Closes older than PRICE_CACHE_FINAL_AFTER_DAYS are final and kept for PRICE_CACHE_TTL (0 - forever),
+# more recent ones may still be corrected upstream and only live for PRICE_CACHE_RECENT_TTL
+PRICE_CACHE_TTL = int(os.getenv('PRICE_CACHE_TTL', 365 * 24 * 3600))
+PRICE_CACHE_RECENT_TTL = int(os.getenv('PRICE_CACHE_RECENT_TTL', 600))
+PRICE_CACHE_FINAL_AFTER_DAYS = int(os.getenv('PRICE_CACHE_FINAL_AFTER_DAYS', 2))
+
+_redis = None
+_key_prefix = 'price'
+
+
+def configure_price_cache(redis_client, key_prefix: str):
+    global _redis, _key_prefix
+    _redis = redis_client
+    _key_prefix = key_prefix
+
+
+def _ttl_for(target_date: str) -> int | None:
+    date = datetime.strptime(target_date, '%Y-%m-%d').date()
+    today = datetime.now().date()
+    if date > today:
+        return None
+    if date >= today - timedelta(days=PRICE_CACHE_FINAL_AFTER_DAYS):
+        return PRICE_CACHE_RECENT_TTL
+    return PRICE_CACHE_TTL
+
+
+async def get_cached_price(source: str, instrument: str, target_date: str) -> dict | None:
+    if not PRICE_CACHE_ENABLED or _redis is None:
+        return None
+
+    try:
+        raw = await _redis.get(f"{_key_prefix}:{source}:{instrument}:{target_date}")
+    except Exception as e:
+        logger.warning(f"Price cache read failed: {e}")
+        return None
+
+    record_cache(f"price_{source}", raw is not None)
+    return json.loads(raw) if raw is not None else None
+
+
+async def store_price(source: str, instrument: str, target_date: str, record: dict):
+    if not PRICE_CACHE_ENABLED or _redis is None:
+        return
+
+    ttl = _ttl_for(target_date)
+    if ttl is None:
+        return
+
+    try:
+        await _redis.set(f"{_key_prefix}:{source}:{instrument}:{target_date}", json.dumps(record), ex=ttl or None)
+    except Exception as e:
+        logger.warning(f"Price cache write failed: {e}")
@@ -0,0 +1,139 @@
+import os
+import json
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+# Per-row results of a running job are checkpointed to a Redis hash, so a restarted or
+# reclaimed job only fetches the rows that have no checkpoint yet
+CHECKPOINT_TTL = int(os.getenv('CHECKPOINT_TTL', 24 * 3600))
+# A pending message whose consumer stopped sending heartbeats for this long is taken over
+JOB_CLAIM_IDLE = float(os.getenv('JOB_CLAIM_IDLE', 120))
+JOB_HEARTBEAT_INTERVAL = JOB_CLAIM_IDLE / 4
+JOB_MAX_DELIVERIES = int(os.getenv('JOB_MAX_DELIVERIES', 3))
+
+_redis = None
+_checkpoint_prefix = None
+
+
+def configure_checkpoints(redis_client, key_prefix: str):
+    global _redis, _checkpoint_prefix
+    _redis = redis_client
+    _checkpoint_prefix = key_prefix
+
+
+def checkpoint_key(job_id: str) -> str:
+    return f"{_checkpoint_prefix}:{job_id}"
+
+
+def finished_key(job_id: str) -> str:
+    return f"{_checkpoint_prefix}:{job_id}:finished"
+
+
+def encode_result(result) -> str:
+    return json.dumps({'error': str(result)} if isinstance(result, Exception) else {'result': result})
+
+
+def decode_result(raw: str):
+    decoded = json.loads(raw)
+    return Exception(decoded['error']) if 'error' in decoded else decoded['result']
+
+
+async def load_checkpoint(job_id: str) -> dict[int, object]:
+    # Failed rows are not returned, a resumed job fetches them again
+    if _redis is None:
+        return {}
+
+    try:
+        raw = await _redis.hgetall(checkpoint_key(job_id))
+    except Exception as e:
+        logger.warning(f"Checkpoint read failed for job {job_id}: {e}")
+        return {}
+
+    results = {}
+    for index, value in raw.items():
+        result = decode_result(value)
+        if not isinstance(result, Exception):
+            results[int(index)] = result
+    return results
+
+
+async def save_checkpoint(job_id: str, results: dict[int, object]):
+    if _redis is None or not results:
+        return
+
+    key = checkpoint_key(job_id)
+    try:
+        async with _redis.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping={index: encode_result(result) for index, result in results.items()})
+            pipe.expire(key, CHECKPOINT_TTL)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Checkpoint write failed for job {job_id}: {e}")
+
+
+async def clear_checkpoint(job_id: str):
+    if _redis is None:
+        return
+
+    try:
+        # the marker keeps shards that finish after the job from bringing the checkpoint back
+        async with _redis.pipeline(transaction=True) as pipe:
+            pipe.delete(checkpoint_key(job_id))
+            pipe.set(finished_key(job_id), 1, ex=CHECKPOINT_TTL)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Checkpoint cleanup failed for job {job_id}: {e}")
+
+
+async def claim_stale_messages(r, stream: str, group: str, consumer: str,
+                               include_own: bool = False) -> list[tuple[str, dict, int]]:
+    # Returns (message_id, fields, times_delivered) for messages this consumer now owns:
+    # its own pending entries (left over from before a restart) and entries of other
+    # consumers that stopped sending heartbeats
+    claimed = []
+    if include_own:
+        own = await r.xpending_range(stream, group, min='-', max='+', count=100, consumername=consumer)
+        if own:
+            # claiming (not just re-reading) bumps the delivery counter, so a job that keeps
+            # crashing the same container is noticed as well
+            messages = await r.xclaim(stream, group, consumer, 0, [entry['message_id'] for entry in own])
+            claimed.extend((message_id, fields) for message_id, fields in messages if fields)
+
+    start_id = '0-0'
+    while True:
+        start_id, messages, *_ = await r.xautoclaim(stream, group, consumer, int(JOB_CLAIM_IDLE * 1000),
+                                                    start_id=start_id, count=10)
+        claimed.extend((message_id, fields) for message_id, fields in messages if fields)
+        if start_id in ('0-0', b'0-0'):
+            break
+
+    result = []
+    for message_id, fields in claimed:
+        pending = await r.xpending_range(stream, group, min=message_id, max=message_id, count=1)
+        deliveries = pending[0]['times_delivered'] if pending else 1
+        logger.info(f"Claimed pending message {message_id} from {stream} (delivery {deliveries})")
+        result.append((message_id, fields, deliveries))
+    return result
+
+
+@asynccontextmanager
+async def keep_claimed(r, stream: str, group: str, consumer: str, message_id: str):
+    # Resets the idle time of a message while it is being processed, so long jobs of a
+    # live worker are never taken over by claim_stale_messages
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                await r.xclaim(stream, group, consumer, 0, [message_id], justid=True)
+            except Exception as e:
+                logger.warning(f"Heartbeat for {message_id} failed: {e}")
+
+    task = asyncio.create_task(heartbeat())
+    try:
+        yield
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
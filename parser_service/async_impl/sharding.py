@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import redis.asyncio as redis
+
+from .recovery import (
+    checkpoint_key, finished_key, encode_result, decode_result, claim_stale_messages, keep_claimed,
+    CHECKPOINT_TTL, JOB_CLAIM_IDLE, JOB_MAX_DELIVERIES
+)
+
+logger = logging.getLogger(__name__)
+
+# Jobs with at least SHARD_MIN_ROWS rows are split into SHARD_SIZE-row shards that any
+# replica can process; the receiving worker merges the per-row results
+JOB_SHARDING = os.getenv('JOB_SHARDING', '0') == '1'
+SHARD_SIZE = int(os.getenv('SHARD_SIZE', 200))
+SHARD_MIN_ROWS = int(os.getenv('SHARD_MIN_ROWS', 500))
+SHARD_DEADLINE = float(os.getenv('SHARD_DEADLINE', 3600))
+MAX_CONCURRENT_SHARDS = int(os.getenv('MAX_CONCURRENT_SHARDS', 2))
+SHARD_POLL_INTERVAL = 1.0
+SHARDS_STREAM_MAXLEN = 10000
+
+# Shard results are only stored while the job is running: a shard that finishes after the
+# coordinator's deadline must not recreate the checkpoint the finished job cleared
+STORE_SHARD_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+_redis = None
+_stream = None
+_group = None
+_store_script = None
+
+
+def configure_sharding(redis_client, stream: str, group: str):
+    global _redis, _stream, _group, _store_script
+    _redis = redis_client
+    _stream = stream
+    _group = group
+    _store_script = redis_client.register_script(STORE_SHARD_SCRIPT)
+
+
+def should_shard(total_rows: int) -> bool:
+    return JOB_SHARDING and _redis is not None and total_rows >= SHARD_MIN_ROWS
+
+
+async def run_sharded(job_id: str, indexes: list[int], items: list, context_for, total_rows: int) -> dict[int, object]:
+    # items are the JSON-serializable records of the rows at indexes, context_for(chunk) builds the
+    # shared data a shard needs. Shard results land in the job checkpoint, which already holds
+    # total_rows - len(indexes) finished rows. Returns row index -> result (or Exception) for
+    # every row that finished before the deadline
+    key = checkpoint_key(job_id)
+    if indexes:
+        # error entries of rows that are fetched again must not count as finished
+        await _redis.hdel(key, *indexes)
+
+    # wall clock, the shards are checked against it on other hosts
+    expires_at = time.time() + SHARD_DEADLINE
+    shard_count = 0
+    for start in range(0, len(items), SHARD_SIZE):
+        chunk = items[start:start + SHARD_SIZE]
+        await _redis.xadd(_stream, {
+            'job_id': job_id,
+            'indexes': json.dumps(indexes[start:start + SHARD_SIZE]),
+            'context': json.dumps(context_for(chunk)),
+            'items': json.dumps(chunk),
+            'deadline': str(expires_at),
+        }, maxlen=SHARDS_STREAM_MAXLEN, approximate=True)
+        shard_count += 1
+    logger.info(f"Job {job_id}: {len(items)} rows split into {shard_count} shards on {_stream}")
+
+    deadline = time.monotonic() + SHARD_DEADLINE
+    while True:
+        done = await _redis.hlen(key)
+        if done >= total_rows:
+            break
+        if time.monotonic() > deadline:
+            logger.warning(f"Job {job_id}: shard deadline passed with {done}/{total_rows} rows done")
+            break
+        await asyncio.sleep(SHARD_POLL_INTERVAL)
+
+    wanted = set(indexes)
+    raw = await _redis.hgetall(key)
+    return {int(index): decode_result(value) for index, value in raw.items() if int(index) in wanted}
+
+
+async def _store_shard(job_id: str, indexes: list[int], results: list, message_id: str):
+    fields = [value for index, result in zip(indexes, results) for value in (index, encode_result(result))]
+    if fields and not await _store_script(keys=[checkpoint_key(job_id), finished_key(job_id)],
+                                          args=[CHECKPOINT_TTL, *fields]):
+        logger.info(f"Shard of job {job_id} finished after the job, results dropped")
+    # a crash before the ack redelivers the shard, storing its results again is harmless
+    await _redis.xack(_stream, _group, message_id)
+
+
+async def consume_shards(consumer: str, handler, stopping: asyncio.Event):
+    # handler(context, indexes, items) returns one result (or Exception) per item
+    if not JOB_SHARDING:
+        return
+
+    try:
+        await _redis.xgroup_create(_stream, _group, id='0', mkstream=True)
+    except redis.ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+    slots = asyncio.Semaphore(MAX_CONCURRENT_SHARDS)
+    running = set()
+
+    async def handle_shard(message_id: str, fields: dict, deliveries: int = 1):
+        try:
+            job_id = fields['job_id']
+            indexes = json.loads(fields['indexes'])
+            items = json.loads(fields['items'])
+            if (time.time() > float(fields.get('deadline', 'inf'))
+                    or await _redis.exists(finished_key(job_id))):
+                # nobody waits for these rows any more, fetching them would only spend upstream budget
+                logger.info(f"Skipping shard of job {job_id}: the job is finished or past its deadline")
+                await _redis.xack(_stream, _group, message_id)
+                return
+            if deliveries > JOB_MAX_DELIVERIES:
+                logger.error(f"Shard of job {job_id} was delivered {deliveries} times, giving up on it")
+                results = [RuntimeError("shard kept crashing its worker")] * len(items)
+            else:
+                logger.info(f"Processing shard of job {job_id}: {len(items)} rows")
+                try:
+                    async with keep_claimed(_redis, _stream, _group, consumer, message_id):
+                        results = await handler(json.loads(fields['context']), indexes, items)
+                except Exception as e:
+                    logger.error(f"Shard of job {job_id} failed: {e}")
+                    results = [e] * len(items)
+            await _store_shard(job_id, indexes, results, message_id)
+        except Exception as e:
+            logger.error(f"Error storing shard results: {e}")
+        finally:
+            slots.release()
+
+    def start_shard(message_id: str, fields: dict, deliveries: int = 1):
+        task = asyncio.create_task(handle_shard(message_id, fields, deliveries))
+        running.add(task)
+        task.add_done_callback(running.discard)
+
+    include_own = True
+    next_claim = 0.0
+    try:
+        while not stopping.is_set():
+            if time.monotonic() >= next_claim:
+                try:
+                    for message_id, fields, deliveries in await claim_stale_messages(
+                            _redis, _stream, _group, consumer, include_own):
+                        await slots.acquire()
+                        start_shard(message_id, fields, deliveries)
+                    include_own = False
+                except Exception as e:
+                    logger.error(f"Error claiming stale shards: {e}")
+                next_claim = time.monotonic() + JOB_CLAIM_IDLE / 2
+
+            try:
+                await asyncio.wait_for(slots.acquire(), timeout=1.0)
+            except asyncio.TimeoutError:
+                continue
+
+            try:
+                messages = await _redis.xreadgroup(_group, consumer, {_stream: '>'}, count=1, block=1000)
+            except Exception as e:
+                slots.release()
+                logger.error(f"Error reading from shard stream: {e}")
+                await asyncio.sleep(5)
+                continue
+
+            if not messages:
+                slots.release()
+                continue
+
+            for stream, stream_messages in messages:
+                for message_id, fields in stream_messages:
+                    start_shard(message_id, fields)
+    finally:
+        # unfinished shards stay pending and are claimed by another replica or after the restart
+        pending = list(running)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
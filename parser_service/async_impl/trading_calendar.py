@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import logging
+from functools import lru_cache
+from datetime import date, datetime, timedelta
+
+from .sessions import http_get
+from .executor import run_cpu
+from .decoders import decode_iss_off_days
+
+logger = logging.getLogger(__name__)
+
+# Jobs for a weekend or exchange holiday only collect empty Investing responses (each row
+# retried INVESTING_MAX_RETRIES times) and pointless MOEX lookups. Before fetching, the worker
+# checks the date against the exchange calendar: 'warn' fails the job right away naming the
+# previous trading day, 'previous' moves the job to that day, 'off' skips the check
+TRADING_CALENDAR_MODE = os.getenv('TRADING_CALENDAR_MODE', 'warn')
+TRADING_CALENDAR_TTL = int(os.getenv('TRADING_CALENDAR_TTL', 7 * 24 * 3600))
+# a failed ISS fetch falls back to the Mon-Fri rule and is retried after this many seconds
+TRADING_CALENDAR_RETRY = 300
+MAX_LOOKBACK_DAYS = 30
+MOEX_CALENDAR_URL = "https://iss.moex.com/iss/calendars.json"
+EXCHANGE_NAMES = {'moex': 'MOEX', 'nyse': 'NYSE'}
+# One-off NYSE closures that no rule produces (national days of mourning)
+NYSE_SPECIAL_CLOSURES = {date(2018, 12, 5), date(2025, 1, 9)}
+
+_redis = None
+_key_prefix = 'calendar'
+# (exchange, year) -> (expires at, date -> traded) of the days that break the Mon-Fri rule
+_exceptions: dict[tuple[str, int], tuple[float, dict[date, bool]]] = {}
+
+
+class NonTradingDayError(Exception):
+    pass
+
+
+def configure_trading_calendar(redis_client, key_prefix: str):
+    global _redis, _key_prefix
+    _redis = redis_client
+    _key_prefix = key_prefix
+
+
+def _easter(year: int) -> date:
+    # Anonymous Gregorian computus
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    # n-th (1-based, -1 for the last) given weekday of the month
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _observed(day: date) -> date:
+    # Saturday holidays are observed on Friday, Sunday ones on Monday
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+@lru_cache(maxsize=None)
+def nyse_holidays(year: int) -> frozenset[date]:
+    holidays = {
+        _nth_weekday(year, 1, 0, 3),                  # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),                  # Washington's Birthday
+        _easter(year) - timedelta(days=2),            # Good Friday
+        _nth_weekday(year, 5, 0, -1),                 # Memorial Day
+        _observed(date(year, 7, 4)),                  # Independence Day
+        _nth_weekday(year, 9, 0, 1),                  # Labor Day
+        _nth_weekday(year, 11, 3, 4),                 # Thanksgiving
+        _observed(date(year, 12, 25)),                # Christmas
+    }
+    # New Year's Day falling on a Saturday is not moved to the Friday before
+    if date(year, 1, 1).weekday() != 5:
+        holidays.add(_observed(date(year, 1, 1)))
+    if year >= 2022:
+        holidays.add(_observed(date(year, 6, 19)))    # Juneteenth
+    holidays.update(day for day in NYSE_SPECIAL_CLOSURES if day.year == year)
+    return frozenset(holidays)
+
+
+async def _fetch_moex_exceptions(year: int) -> dict[date, bool]:
+    key = f"{_key_prefix}:moex:{year}"
+    if _redis is not None:
+        try:
+            raw = await _redis.get(key)
+            if raw is not None:
+                return {date.fromisoformat(day): traded for day, traded in json.loads(raw).items()}
+        except Exception as e:
+            logger.warning(f"Trading calendar cache read failed: {e}")
+
+    url = f"{MOEX_CALENDAR_URL}?iss.meta=off&iss.only=off_days&from={year}-01-01&till={year}-12-31"
+    response = await http_get(url, timeout=30, impersonate="chrome120")
+    response.raise_for_status()
+    off_days = await run_cpu(decode_iss_off_days, response.content, size=len(response.content))
+    logger.info(f"MOEX calendar {year}: {len(off_days)} days differ from Mon-Fri")
+
+    if _redis is not None:
+        try:
+            await _redis.set(key, json.dumps(off_days), ex=TRADING_CALENDAR_TTL)
+        except Exception as e:
+            logger.warning(f"Trading calendar cache write failed: {e}")
+    return {date.fromisoformat(day): traded for day, traded in off_days.items()}
+
+
+async def _exceptions_for(exchange: str, year: int) -> dict[date, bool]:
+    cached = _exceptions.get((exchange, year))
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+
+    ttl = TRADING_CALENDAR_TTL
+    if exchange == 'nyse':
+        exceptions = {day: False for day in nyse_holidays(year)}
+    else:
+        try:
+            exceptions = await _fetch_moex_exceptions(year)
+        except Exception as e:
+            logger.warning(f"MOEX calendar for {year} unavailable, assuming Mon-Fri trading: {e}")
+            exceptions, ttl = {}, TRADING_CALENDAR_RETRY
+    _exceptions[(exchange, year)] = (time.monotonic() + ttl, exceptions)
+    return exceptions
+
+
+async def is_trading_day(exchange: str, day: date) -> bool:
+    traded = (await _exceptions_for(exchange, day.year)).get(day)
+    return day.weekday() < 5 if traded is None else traded
+
+
+async def previous_trading_day(exchange: str, day: date) -> date | None:
+    for offset in range(1, MAX_LOOKBACK_DAYS + 1):
+        candidate = day - timedelta(days=offset)
+        if await is_trading_day(exchange, candidate):
+            return candidate
+    return None
+
+
+async def resolve_trading_date(exchange: str, day: datetime) -> tuple[datetime, str | None]:
+    # Returns the date to fetch and a note for the user when it was moved
+    if TRADING_CALENDAR_MODE not in ('warn', 'previous') or await is_trading_day(exchange, day.date()):
+        return day, None
+
+    name = EXCHANGE_NAMES.get(exchange, exchange)
+    previous = await previous_trading_day(exchange, day.date())
+    if previous is None:
+        raise NonTradingDayError(f"{day:%d.%m.%Y} is not a trading day on {name}")
+    if TRADING_CALENDAR_MODE == 'warn':
+        raise NonTradingDayError(
+            f"{day:%d.%m.%Y} is not a trading day on {name}, the previous trading day is {previous:%d.%m.%Y}")
+
+    logger.info(f"{day:%d.%m.%Y} is not a trading day on {name}, using {previous:%d.%m.%Y}")
+    return (datetime(previous.year, previous.month, previous.day),
+            f"{day:%d.%m.%Y} is not a trading day on {name}, prices are for {previous:%d.%m.%Y}")
@@ -19,7 +19,7 @@ docker-compose down
 echo ""
 echo "🧹 Removing old containers and images..."
 docker-compose rm -f
-docker-compose down --rmi local --volumes --remove-orphans
+docker-compose down --rmi local --remove-orphans
 
 echo ""
 echo "🐳 Rebuilding and starting containers with latest code..."
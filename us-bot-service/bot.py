@@ -2,6 +2,7 @@
 import os
 import sys
 import json
+import time
 import asyncio
 import logging
 import redis.asyncio as redis
@@ -20,6 +21,12 @@ from pathlib import Path
 import uuid
 from functools import wraps
 
+from payload import pack_payload, unpack_payload, drop_payload, decode_fields
+from metrics import (
+    start_metrics_server, monitor_queues, monitor_loop_lag, record_loop_stall, JOBS_SUBMITTED, RESULTS, RESULT_DELIVERY
+)
+from loop_watchdog import start_loop_watchdog
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -39,9 +46,14 @@ TELEGRAM_PROXY = os.getenv('TELEGRAM_PROXY')
 ALLOWED_USER_IDS_STR = os.getenv('US_ALLOWED_USER_IDS', '')
 JOBS_STREAM = 'us_parser:jobs'
 RESULTS_STREAM = 'us_parser:results'
+BLOB_PREFIX = 'us_parser:blob'
+REPORT_PREFIX = 'us_parser:report'
+PROFILE_PREFIX = 'us_parser:profile'
 CONSUMER_GROUP = 'us-bot-service'
 
 redis_client = None
+# Result payloads are raw bytes, so the result stream is read without response decoding
+binary_redis_client = None
 
 ALLOWED_USER_IDS = set()
 if ALLOWED_USER_IDS_STR:
@@ -81,6 +93,17 @@ async def get_redis():
     return redis_client
 
 
+async def get_binary_redis():
+    global binary_redis_client
+    if binary_redis_client is None:
+        binary_redis_client = redis.Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            decode_responses=False
+        )
+    return binary_redis_client
+
+
 @authorized_only
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
@@ -112,6 +135,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "1. Отправьте команду /reparse\n"
         "2. Загрузите Excel файл со строками с ERROR в столбце E\n"
         "3. Бот повторно обработает только строки с ошибками\n\n"
+        "Отчёт о производительности задачи: /report <job_id>\n"
+        "Профилирование: /parse profile или /reparse profile, результат: /profile <job_id>\n"
         "Используйте /cancel для отмены текущей операции."
     )
 
@@ -120,6 +145,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def parse_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     logger.info(f"User {user.id} (@{user.username or 'unknown'}) invoked /parse")
+    context.user_data['profile'] = bool(context.args) and context.args[0].lower() == 'profile'
     await update.message.reply_text(
         "📁 Пожалуйста, отправьте мне Excel файл (шаблон котировок) для обработки."
     )
@@ -233,12 +259,15 @@ async def _send_parse_job(update: Update, context: ContextTypes.DEFAULT_TYPE, li
         'user_id': str(user_id),
         'filename': original_filename,
         'date': date_str,
-        'file_content': file_content.hex(),
     }
+    job_data.update(await pack_payload(r, file_content, f"{BLOB_PREFIX}:{job_id}:job"))
     if limit is not None:
         job_data['limit'] = str(limit)
+    if context.user_data.get('profile'):
+        job_data['profile'] = '1'
 
     await r.xadd(JOBS_STREAM, job_data)
+    JOBS_SUBMITTED.labels('parse').inc()
 
     username = update.effective_user.username or "unknown"
     limit_text = f"первые {limit} строк" if limit is not None else "все строки"
@@ -254,6 +283,8 @@ async def _send_parse_job(update: Update, context: ContextTypes.DEFAULT_TYPE, li
         f"⏳ Это может занять несколько минут. Я отправлю вам результат, когда он будет готов.\n\n"
         f"ID задачи: {job_id}"
     )
+    if context.user_data.get('profile'):
+        await update.effective_message.reply_text(f"🔬 Задача выполняется под профилировщиком, результат: /profile {job_id}")
 
     context.user_data['job_id'] = job_id
     context.user_data['chat_id'] = update.effective_chat.id
@@ -265,6 +296,7 @@ async def _send_parse_job(update: Update, context: ContextTypes.DEFAULT_TYPE, li
 async def reparse_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     logger.info(f"User {user.id} (@{user.username or 'unknown'}) invoked /reparse")
+    context.user_data['profile'] = bool(context.args) and context.args[0].lower() == 'profile'
     await update.message.reply_text(
         "📁 Пожалуйста, отправьте мне Excel файл с ERROR в столбце E для повторной обработки."
     )
@@ -298,11 +330,14 @@ async def reparse_file_received(update: Update, context: ContextTypes.DEFAULT_TY
         'job_id': job_id,
         'user_id': str(user_id),
         'filename': document.file_name,
-        'file_content': file_content.hex(),
         'mode': 'reparse',
     }
+    job_data.update(await pack_payload(r, file_content, f"{BLOB_PREFIX}:{job_id}:job"))
+    if context.user_data.get('profile'):
+        job_data['profile'] = '1'
 
     await r.xadd(JOBS_STREAM, job_data)
+    JOBS_SUBMITTED.labels('reparse').inc()
 
     username = update.effective_user.username or "unknown"
     logger.info(
@@ -316,6 +351,8 @@ async def reparse_file_received(update: Update, context: ContextTypes.DEFAULT_TY
         f"⏳ Это может занять несколько минут. Я отправлю вам результат, когда он будет готов.\n\n"
         f"ID задачи: {job_id}"
     )
+    if context.user_data.get('profile'):
+        await update.effective_message.reply_text(f"🔬 Задача выполняется под профилировщиком, результат: /profile {job_id}")
 
     Path(file_path).unlink(missing_ok=True)
 
@@ -337,8 +374,117 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 
+def load_report(raw: str | None) -> dict | None:
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return None
+
+
+def format_report(report: dict, full: bool = False) -> str:
+    counters = report.get('counters', {})
+    lines = [f"⏱ Время: {report.get('total', 0):.1f} с"]
+
+    stages = report.get('stages', {})
+    if stages:
+        lines.append("Этапы: " + ", ".join(f"{name} {seconds:.1f} с" for name, seconds in stages.items()))
+    cumulative = report.get('cumulative', {})
+    if full and cumulative:
+        lines.append("Суммарно по строкам: " + ", ".join(f"{name} {seconds:.1f} с" for name, seconds in cumulative.items()))
+
+    requests = counters.get('requests', {})
+    retries = counters.get('retries', {})
+    if requests:
+        lines.append("🌐 Запросы: " + ", ".join(
+            f"{host} {count}" + (f" (повторов: {retries[host]})" if retries.get(host) else "")
+            for host, count in sorted(requests.items(), key=lambda item: -item[1])
+        ))
+    failed = counters.get('failed_requests', {})
+    if full and failed:
+        lines.append("⚠️ Неуспешные ответы: " + ", ".join(f"{key} × {count}" for key, count in sorted(failed.items())))
+
+    hits = counters.get('cache_hits', {})
+    misses = counters.get('cache_misses', {})
+    lookups = sum(hits.values()) + sum(misses.values())
+    if lookups:
+        lines.append(f"💾 Кэш: {sum(hits.values())}/{lookups} попаданий")
+        if full:
+            for cache in sorted(hits.keys() | misses.keys()):
+                lines.append(f"  {cache}: {hits.get(cache, 0)}/{hits.get(cache, 0) + misses.get(cache, 0)}")
+
+    slowest = report.get('slowest', [])
+    if slowest:
+        shown = slowest if full else slowest[:3]
+        if full:
+            lines.append("🐢 Самые медленные строки:")
+            lines.extend(f"  {row['row']}: {row['seconds']:.1f} с" for row in shown)
+        else:
+            lines.append("🐢 Медленнее всего: " + ", ".join(f"{row['row']} {row['seconds']:.1f} с" for row in shown))
+    return "\n".join(lines)
+
+
+@authorized_only
+async def report_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not context.args:
+        await update.message.reply_text("Использование: /report <job_id>")
+        return
+
+    job_id = context.args[0]
+    r = await get_redis()
+    report = load_report(await r.get(f"{REPORT_PREFIX}:{job_id}"))
+    if report is None or report.get('user_id') != str(update.effective_user.id):
+        await update.message.reply_text("❌ Отчёт не найден (отчёты хранятся ограниченное время)")
+        return
+
+    await update.message.reply_text(
+        f"📈 Отчёт по задаче {job_id}\n"
+        f"Файл: {report.get('filename')}, режим: {report.get('mode')}, статус: {report.get('status')}\n\n"
+        f"{format_report(report, full=True)}"
+    )
+
+
+@authorized_only
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not context.args:
+        await update.message.reply_text("Использование: /profile <job_id>")
+        return
+
+    job_id = context.args[0]
+    r = await get_redis()
+    profile = load_report(await r.get(f"{PROFILE_PREFIX}:{job_id}"))
+    if profile is None or profile.get('user_id') != str(update.effective_user.id):
+        await update.message.reply_text("❌ Профиль не найден (задача запускалась без profile или профиль устарел)")
+        return
+
+    samples = profile.get('samples', {})
+    lines = [
+        f"🔬 Профиль задачи {job_id}",
+        f"Сэмплов: задача {samples.get('job', 0)} (из них в пуле CPU {samples.get('cpu_pool', 0)}), другие задачи {samples.get('other_jobs', 0)}, "
+        f"ожидание I/O {samples.get('idle', 0)} (шаг {profile.get('interval', 0) * 1000:.0f} мс)",
+        "",
+        "Собственное время:",
+    ]
+    lines.extend(f"  {entry['share'] * 100:.1f}% {entry['function']}" for entry in profile.get('top_self', [])[:10])
+    memory = profile.get('memory')
+    if memory:
+        lines.append("")
+        lines.append(f"Память всего воркера, с параллельными задачами: пик {memory['peak_mb']} МБ, крупнейшие выделения:")
+        lines.extend(f"  {entry['size_diff_kb']:+.0f} КБ {entry['site']}" for entry in memory['top_allocations'][:10])
+    await update.message.reply_text("\n".join(lines))
+
+    if profile.get('folded'):
+        await update.message.reply_document(
+            document=profile['folded'].encode(),
+            filename=f"profile_{job_id}.folded.txt",
+            caption="Стеки в формате flamegraph.pl / speedscope"
+        )
+
+
 async def listen_for_results(application: Application):
     r = await get_redis()
+    rb = await get_binary_redis()
 
     try:
         await r.xgroup_create(RESULTS_STREAM, CONSUMER_GROUP, id='0', mkstream=True)
@@ -349,7 +495,7 @@ async def listen_for_results(application: Application):
 
     while True:
         try:
-            messages = await r.xreadgroup(
+            messages = await rb.xreadgroup(
                 CONSUMER_GROUP,
                 'bot-consumer',
                 {RESULTS_STREAM: '>'},
@@ -360,7 +506,7 @@ async def listen_for_results(application: Application):
             for stream, stream_messages in messages:
                 for message_id, data in stream_messages:
                     try:
-                        await process_result(application, data)
+                        await process_result(application, decode_fields(data))
                         await r.xack(RESULTS_STREAM, CONSUMER_GROUP, message_id)
                     except Exception as e:
                         logger.error(f"Error processing result: {e}")
@@ -374,9 +520,14 @@ async def process_result(application: Application, data: dict):
     job_id = data.get('job_id')
     user_id = int(data.get('user_id'))
     status = data.get('status')
+    started = time.perf_counter()
+    report = load_report(data.get('report'))
+    report_text = f"\n\n{format_report(report)}\nПодробнее: /report {job_id}" if report else ""
+    if report and report.get('profiled'):
+        report_text += f", профиль: /profile {job_id}"
 
     if status == 'success':
-        file_content = bytes.fromhex(data.get('file_content'))
+        file_content = await unpack_payload(await get_binary_redis(), data)
         filename = data.get('filename')
         summary = data.get('summary', '')
 
@@ -384,7 +535,7 @@ async def process_result(application: Application, data: dict):
 
         await application.bot.send_message(
             chat_id=user_id,
-            text=f"✅ Обработка завершена!\n\n{summary}"
+            text=f"✅ Обработка завершена!\n\n{summary}{report_text}"
         )
 
         await application.bot.send_document(
@@ -394,19 +545,29 @@ async def process_result(application: Application, data: dict):
             caption="Вот ваш обработанный файл 📊"
         )
         logger.info(f"User {user_id} successfully received result for job {job_id} ({filename})")
+        await drop_payload(await get_redis(), data)
+        RESULTS.labels('success').inc()
 
     elif status == 'error':
         error_message = data.get('error', 'Unknown error')
 
         await application.bot.send_message(
             chat_id=user_id,
-            text=f"❌ Обработка не удалась!\n\nОшибка: {error_message}"
+            text=f"❌ Обработка не удалась!\n\nОшибка: {error_message}{report_text}"
         )
         logger.error(f"User {user_id} received error for job {job_id}: {error_message}")
+        RESULTS.labels('error').inc()
+
+    RESULT_DELIVERY.observe(time.perf_counter() - started)
 
 
 async def post_init(application: Application):
+    start_metrics_server()
+    r = await get_redis()
     asyncio.create_task(listen_for_results(application))
+    asyncio.create_task(monitor_queues(r, [(JOBS_STREAM, None), (RESULTS_STREAM, CONSUMER_GROUP)]))
+    asyncio.create_task(monitor_loop_lag())
+    start_loop_watchdog(on_stall=record_loop_stall)
 
 
 def main():
@@ -461,6 +622,8 @@ def main():
 
     application.add_handler(CommandHandler('start', start))
     application.add_handler(CommandHandler('help', help_command))
+    application.add_handler(CommandHandler('report', report_command))
+    application.add_handler(CommandHandler('profile', profile_command))
     application.add_handler(conv_handler)
     application.add_handler(reparse_conv_handler)
 
@@ -0,0 +1,106 @@
+import os
+import zlib
+import logging
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Workbooks travel through the job/result streams as raw (optionally compressed) bytes;
+# payloads above PAYLOAD_INLINE_LIMIT are stored under a blob key and only the key is queued.
+# The same module is shipped with the bots and the parser services
+PAYLOAD_COMPRESSION = os.getenv('PAYLOAD_COMPRESSION', 'zlib')
+PAYLOAD_INLINE_LIMIT = int(os.getenv('PAYLOAD_INLINE_LIMIT', 512 * 1024))
+PAYLOAD_BLOB_TTL = int(os.getenv('PAYLOAD_BLOB_TTL', 3 * 24 * 3600))
+# Only the result streams are capped by length; job streams are trimmed by trim_acked
+STREAM_MAXLEN = int(os.getenv('STREAM_MAXLEN', 1000))
+
+PAYLOAD_FIELD = 'file_content'
+REF_FIELD = 'file_ref'
+ENCODING_FIELD = 'file_encoding'
+# xlsx is already a zip archive, keep it as is unless compression actually pays off
+MIN_COMPRESSION_GAIN = 0.9
+
+
+def _compress(data: bytes) -> tuple[str, bytes]:
+    if PAYLOAD_COMPRESSION == 'zstd' and zstandard is not None:
+        encoding, packed = 'zstd', zstandard.ZstdCompressor(level=3).compress(data)
+    elif PAYLOAD_COMPRESSION in ('zlib', 'zstd'):
+        encoding, packed = 'zlib', zlib.compress(data, 6)
+    else:
+        return 'raw', data
+
+    if len(packed) > len(data) * MIN_COMPRESSION_GAIN:
+        return 'raw', data
+    return encoding, packed
+
+
+def _decompress(encoding: str, packed: bytes) -> bytes:
+    if encoding == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("Payload is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(packed)
+    if encoding == 'zlib':
+        return zlib.decompress(packed)
+    if encoding == 'hex':
+        return bytes.fromhex(packed.decode() if isinstance(packed, bytes) else packed)
+    return packed
+
+
+async def pack_payload(r, data: bytes, blob_key: str) -> dict:
+    encoding, packed = _compress(data)
+    if len(packed) > PAYLOAD_INLINE_LIMIT:
+        await r.set(blob_key, packed, ex=PAYLOAD_BLOB_TTL)
+        return {ENCODING_FIELD: encoding, REF_FIELD: blob_key}
+    return {ENCODING_FIELD: encoding, PAYLOAD_FIELD: packed}
+
+
+async def unpack_payload(binary_redis, fields: dict) -> bytes:
+    # fields come from a binary-safe client through decode_fields; entries queued before
+    # the switch carry no encoding field and a hex string payload
+    encoding = fields.get(ENCODING_FIELD, 'hex')
+    if REF_FIELD in fields:
+        packed = await binary_redis.get(fields[REF_FIELD])
+        if packed is None:
+            raise ValueError(f"Payload {fields[REF_FIELD]} has expired")
+    else:
+        packed = fields[PAYLOAD_FIELD]
+    return _decompress(encoding, packed)
+
+
+async def drop_payload(r, fields: dict):
+    if REF_FIELD not in fields:
+        return
+    try:
+        await r.delete(fields[REF_FIELD])
+    except Exception as e:
+        logger.warning(f"Could not delete payload {fields[REF_FIELD]}: {e}")
+
+
+async def trim_acked(r, stream: str, group: str):
+    # Drops only the entries before the oldest one the group still has pending, or up to
+    # the last delivered one when nothing is pending: queued jobs are never trimmed away
+    try:
+        pending = await r.xpending(stream, group)
+        if pending['pending']:
+            min_id = pending['min']
+        else:
+            groups = await r.xinfo_groups(stream)
+            name = group.encode() if groups and isinstance(groups[0]['name'], bytes) else group
+            min_id = next((info['last-delivered-id'] for info in groups if info['name'] == name), None)
+        if min_id is not None:
+            await r.xtrim(stream, minid=min_id, approximate=True)
+    except Exception as e:
+        logger.warning(f"Could not trim {stream}: {e}")
+
+
+def decode_fields(fields: dict) -> dict:
+    # A binary-safe client returns every field as bytes, only the payload stays binary
+    decoded = {}
+    for key, value in fields.items():
+        key = key.decode() if isinstance(key, bytes) else key
+        decoded[key] = value.decode() if isinstance(value, bytes) and key != PAYLOAD_FIELD else value
+    return decoded
@@ -1,3 +1,42 @@
 from .investing_parser import get_stock_id_async, get_stock_data_async, get_investing_price_async
+from .instrument_cache import configure_instrument_cache, canonicalize_url
+from .price_cache import configure_price_cache, get_cached_price, store_price
+from .sessions import http_get, close_sessions
+from .rate_limiter import limiter_stats
+from .circuit_breaker import UpstreamBlockedError, breaker_stats
+from .distributed_limiter import configure_distributed_limiter
+from .task_pool import run_pool
+from .job_stats import JobStats, current_job_stats, add_time, add_row_time
+from .workbook import iter_sheet_rows, read_cell, write_cells
+from .recovery import (
+    configure_checkpoints, load_checkpoint, save_checkpoint, clear_checkpoint, claim_stale_messages, keep_claimed,
+    JOB_CLAIM_IDLE, JOB_MAX_DELIVERIES
+)
+from .sharding import configure_sharding, should_shard, run_sharded, consume_shards
+from .payload import pack_payload, unpack_payload, drop_payload, trim_acked, decode_fields, STREAM_MAXLEN
+from .metrics import (
+    start_metrics_server, monitor_queues, monitor_loop_lag, record_retry, record_row, observe_job, observe_fetch_rate,
+    record_loop_stall
+)
+from .profiling import configure_profiling, should_profile, profile_job
+from .executor import run_cpu, iter_cpu, close_executor, run_event_loop
+from .loop_watchdog import start_loop_watchdog
+from .decoders import MoexRecord, PriceRecord, decode_cbr_rates
+from .trading_calendar import configure_trading_calendar, resolve_trading_date, NonTradingDayError
 
-__all__ = ['get_stock_id_async', 'get_stock_data_async', 'get_investing_price_async']
+__all__ = ['get_stock_id_async', 'get_stock_data_async', 'get_investing_price_async',
+           'configure_instrument_cache', 'canonicalize_url',
+           'configure_price_cache', 'get_cached_price', 'store_price',
+           'http_get', 'close_sessions',
+           'limiter_stats', 'configure_distributed_limiter', 'UpstreamBlockedError', 'breaker_stats',
+           'run_pool', 'JobStats', 'current_job_stats', 'add_time', 'add_row_time',
+           'iter_sheet_rows', 'read_cell', 'write_cells',
+           'configure_checkpoints', 'load_checkpoint', 'save_checkpoint', 'clear_checkpoint',
+           'claim_stale_messages', 'keep_claimed', 'JOB_CLAIM_IDLE', 'JOB_MAX_DELIVERIES',
+           'configure_sharding', 'should_shard', 'run_sharded', 'consume_shards',
+           'pack_payload', 'unpack_payload', 'drop_payload', 'trim_acked', 'decode_fields', 'STREAM_MAXLEN',
+           'start_metrics_server', 'monitor_queues', 'monitor_loop_lag', 'record_retry', 'record_row',
+           'observe_job', 'observe_fetch_rate', 'record_loop_stall', 'start_loop_watchdog',
+           'configure_profiling', 'should_profile', 'profile_job',
+           'run_cpu', 'iter_cpu', 'close_executor', 'run_event_loop', 'MoexRecord', 'PriceRecord', 'decode_cbr_rates',
+           'configure_trading_calendar', 'resolve_trading_date', 'NonTradingDayError']
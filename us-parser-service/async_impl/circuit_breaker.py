@@ -0,0 +1,118 @@
+import os
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_BREAKER_THRESHOLD = int(os.getenv('CIRCUIT_BREAKER_THRESHOLD', 3))
+CIRCUIT_BREAKER_COOLDOWN = float(os.getenv('CIRCUIT_BREAKER_COOLDOWN', 60.0))
+CIRCUIT_BREAKER_MAX_COOLDOWN = float(os.getenv('CIRCUIT_BREAKER_MAX_COOLDOWN', 600.0))
+CIRCUIT_BREAKER_PROBE_TIMEOUT = 60.0
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class UpstreamBlockedError(Exception):
+    pass
+
+
+# Opens after CIRCUIT_BREAKER_THRESHOLD consecutive block signals and holds every request
+# to the host for the cool-down; then a single probe request decides whether to close again
+# or reopen with a doubled cool-down. The state lives in the worker process, every replica
+# trips its own breaker; the fleet-wide pacing is the distributed limiter's job
+class CircuitBreaker:
+    def __init__(self, host: str, threshold: int, cooldown: float, max_cooldown: float):
+        self.host = host
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+        self.state = CLOSED
+        self.consecutive_blocks = 0
+        self.opened_until = 0.0
+        self.probe_started = None
+        self.probe_task = None
+        self.opened_count = 0
+
+    async def acquire(self) -> bool:
+        # Returns True when the caller is the half-open probe
+        while True:
+            if self.state == CLOSED:
+                return False
+
+            now = time.monotonic()
+            if self.state == OPEN:
+                if now < self.opened_until:
+                    await asyncio.sleep(self.opened_until - now)
+                    continue
+                self.state = HALF_OPEN
+                self.probe_started = None
+
+            if self.probe_started is None or now - self.probe_started > CIRCUIT_BREAKER_PROBE_TIMEOUT:
+                self.probe_started = now
+                self.probe_task = asyncio.current_task()
+                logger.info(f"Circuit breaker {self.host}: letting a probe request through")
+                return True
+            await asyncio.sleep(1.0)
+
+    def probe_failed(self):
+        # Probe ended without a verdict (network error, error status), let the next request probe
+        # again; calls from tasks other than the probe's are ignored
+        if self.state == HALF_OPEN and self.probe_task is asyncio.current_task():
+            self.probe_started = None
+            self.probe_task = None
+
+    def record_block(self, reason: str):
+        self.consecutive_blocks += 1
+
+        if self.state == HALF_OPEN:
+            self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+            self._open(reason)
+        elif self.state == CLOSED and self.consecutive_blocks >= self.threshold:
+            self._open(reason)
+
+    def record_success(self):
+        self.consecutive_blocks = 0
+        if self.state != CLOSED:
+            logger.info(f"Circuit breaker {self.host}: closed, upstream is responding normally")
+            self.state = CLOSED
+            self.cooldown = self.base_cooldown
+
+    def _open(self, reason: str):
+        self.state = OPEN
+        self.opened_until = time.monotonic() + self.cooldown
+        self.opened_count += 1
+        logger.warning(
+            f"Circuit breaker {self.host}: OPEN after {self.consecutive_blocks} block signals ({reason}), "
+            f"pausing requests for {self.cooldown:.0f}s"
+        )
+
+    def stats(self) -> dict:
+        return {
+            'host': self.host,
+            'state': self.state,
+            'consecutive_blocks': self.consecutive_blocks,
+            'opened_count': self.opened_count,
+        }
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(host: str) -> CircuitBreaker | None:
+    if not host.endswith('investing.com'):
+        return None
+
+    breaker = _breakers.get(host)
+    if breaker is None:
+        breaker = CircuitBreaker(host, CIRCUIT_BREAKER_THRESHOLD, CIRCUIT_BREAKER_COOLDOWN, CIRCUIT_BREAKER_MAX_COOLDOWN)
+        _breakers[host] = breaker
+    return breaker
+
+
+def breaker_stats() -> list[dict]:
+    return [breaker.stats() for breaker in _breakers.values()]
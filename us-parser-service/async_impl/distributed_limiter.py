@@ -0,0 +1,106 @@
+import os
+import time
+import random
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+DISTRIBUTED_LIMITER = os.getenv('DISTRIBUTED_LIMITER', '1') == '1'
+BUDGETS_KEY = 'ratelimit:budgets'
+BUDGETS_REFRESH_INTERVAL = 30.0
+
+# requests per second and burst size per upstream host, shared by every worker replica
+# of both parser services; overridden per host in the BUDGETS_KEY hash as "rate,burst".
+# A key starting with a dot is a suffix rule: hosts without an exact entry that fall under
+# it (www.investing.com from a user's sheet) share that one budget
+DEFAULT_BUDGETS = {
+    'ru.investing.com': (2.0, 4),
+    'api.investing.com': (3.0, 6),
+    '.investing.com': (1.0, 2),
+    'iss.moex.com': (10.0, 20),
+    'cbr.ru': (2.0, 2),
+}
+
+# GCRA: the key holds the theoretical arrival time (ms) of the next request;
+# returns 0 when the request is admitted, otherwise the number of ms to wait
+GCRA_SCRIPT = """
+local interval = math.floor(tonumber(ARGV[1]))
+local tolerance = math.floor(tonumber(ARGV[2]))
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+local allow_at = tat - tolerance
+if now < allow_at then
+    return allow_at - now
+end
+local new_tat = tat + interval
+redis.call('SET', KEYS[1], new_tat, 'PX', new_tat - now + interval)
+return 0
+"""
+
+_redis = None
+_script = None
+_budgets: dict[str, tuple[float, int]] = dict(DEFAULT_BUDGETS)
+_budgets_loaded_at = 0.0
+
+
+def configure_distributed_limiter(redis_client):
+    global _redis, _script
+    _redis = redis_client
+    _script = redis_client.register_script(GCRA_SCRIPT)
+
+
+async def _refresh_budgets():
+    global _budgets, _budgets_loaded_at
+    _budgets_loaded_at = time.monotonic()
+
+    overrides = await _redis.hgetall(BUDGETS_KEY)
+    budgets = dict(DEFAULT_BUDGETS)
+    for host, value in overrides.items():
+        try:
+            rate, burst = value.split(',')
+            budgets[host] = (float(rate), int(burst))
+        except ValueError:
+            logger.warning(f"Invalid rate limit budget for {host}: {value!r} (expected 'rate,burst')")
+    _budgets = budgets
+
+
+def _budget_for(host: str) -> tuple[str, tuple[float, int]] | None:
+    # (limiter key, budget): the exact host first, then the longest suffix rule it falls under
+    budget = _budgets.get(host)
+    if budget is not None:
+        return host, budget
+    rules = sorted((rule for rule in _budgets if rule.startswith('.')), key=len, reverse=True)
+    for rule in rules:
+        if host.endswith(rule) or host == rule[1:]:
+            return rule, _budgets[rule]
+    return None
+
+
+async def acquire_distributed(host: str):
+    if not DISTRIBUTED_LIMITER or _redis is None:
+        return
+
+    try:
+        if time.monotonic() - _budgets_loaded_at > BUDGETS_REFRESH_INTERVAL:
+            await _refresh_budgets()
+
+        matched = _budget_for(host)
+        if matched is None:
+            return
+
+        key, (rate, burst) = matched
+        interval = int(1000 / rate)
+        tolerance = interval * (burst - 1)
+
+        while True:
+            wait_ms = await _script(keys=[f"ratelimit:{key}"], args=[interval, tolerance])
+            if not wait_ms:
+                return
+            await asyncio.sleep(wait_ms / 1000 + random.uniform(0, 0.05))
+    except Exception as e:
+        logger.warning(f"Distributed rate limiter unavailable for {host}, proceeding: {e}")
@@ -0,0 +1,63 @@
+import re
+import html
+
+# Byte-level lookups in server-rendered pages: the few values we need sit at known markers,
+# so slicing them out skips building a DOM of the whole (several hundred KB) page.
+# Every function returns None or raises ValueError when the page does not look as expected,
+# callers fall back to a full BeautifulSoup parse then
+NEXT_DATA_MARKER = b'id="__NEXT_DATA__"'
+TAG_RE = re.compile(r'<[^>]*>')
+TAG_NAME_RE = re.compile(rb'<([a-zA-Z][\w-]*)')
+
+
+def scan_next_data(page: bytes) -> bytes | None:
+    # body of <script id="__NEXT_DATA__" ...>, the JSON state of a Next.js page
+    marker = page.find(NEXT_DATA_MARKER)
+    if marker < 0:
+        return None
+    tag_start = page.rfind(b'<', 0, marker)
+    if tag_start < 0 or not page.startswith(b'<script', tag_start):
+        return None
+    body_start = page.find(b'>', marker) + 1
+    body_end = page.find(b'</script>', body_start)
+    if body_start == 0 or body_end < 0:
+        return None
+    return page[body_start:body_end]
+
+
+def find_instrument_id(next_data) -> int | None:
+    # First {"identifiers": {"instrument_id": ...}} in document order: keys are walked in order
+    # and the value of each key is searched before the keys after it
+    stack = [iter([(None, next_data)])]
+    while stack:
+        item = next(stack[-1], None)
+        if item is None:
+            stack.pop()
+            continue
+        key, node = item
+        if key == 'identifiers' and isinstance(node, dict) and node.get('instrument_id') is not None:
+            return int(node['instrument_id'])
+        if isinstance(node, dict):
+            stack.append(iter(node.items()))
+        elif isinstance(node, list):
+            stack.append((None, value) for value in node)
+    return None
+
+
+def scan_element_text(page: bytes, data_test: str) -> str | None:
+    # Text of the element with data-test="...", stripped text nodes joined like get_text(strip=True)
+    marker = page.find(f'data-test="{data_test}"'.encode())
+    if marker < 0:
+        return None
+    tag_start = page.rfind(b'<', 0, marker)
+    name = TAG_NAME_RE.match(page, tag_start) if tag_start >= 0 else None
+    if name is None:
+        raise ValueError(f"{data_test}: element start not found")
+    body_start = page.find(b'>', marker) + 1
+    body_end = page.find(b'</' + name.group(1) + b'>', body_start)
+    if body_start == 0 or body_end < 0:
+        raise ValueError(f"{data_test}: element end not found")
+    body = page[body_start:body_end]
+    if b'<' + name.group(1) in body:
+        raise ValueError(f"{data_test}: nested <{name.group(1).decode()}> elements")
+    return ''.join(html.unescape(text).strip() for text in TAG_RE.split(body.decode('utf-8', 'replace')))
@@ -1,55 +1,99 @@
 import asyncio
 import re
 import logging
-from curl_cffi.requests import AsyncSession
 from bs4 import BeautifulSoup
 
+from .sessions import http_get, report_clean, report_blocked, report_transient
+from .metrics import record_retry
+from .executor import run_cpu
+from .decoders import PriceRecord, loads, investing_history_records
+from .html_scan import scan_next_data, find_instrument_id, scan_element_text
+from .rate_limiter import THROTTLE_STATUSES
+from .circuit_breaker import UpstreamBlockedError
+from .instrument_cache import get_cached_instrument, store_instrument, INSTRUMENT_CACHE_REFRESH
+
 logger = logging.getLogger(__name__)
 
 
+class StaleInstrumentError(Exception):
+    pass
+
+
+def _currency_from_label(label: str | None) -> str | None:
+    # "Валюта в" and the code in a nested span are glued together: "Валюта вUSD"
+    return label.split()[-1][1:] if label else None
+
+
+def _extract_instrument_soup(page: bytes) -> tuple[int, str | None] | None:
+    soup = BeautifulSoup(page.decode('utf-8', 'replace'), "html.parser")
+    script_tag = soup.find("script", id="__NEXT_DATA__")
+    if script_tag is None:
+        return None
+
+    match = re.search(r'"identifiers"\s*:\s*\{[^}]*"instrument_id"\s*:\s*"?(\d+)"?', script_tag.text)
+    if match is None:
+        raise ValueError("instrument_id not found in identifiers object")
+
+    currency_tag = soup.find(attrs={"data-test": "currency-in-label"})
+    return int(match.group(1)), _currency_from_label(currency_tag.get_text(strip=True) if currency_tag else None)
+
+
+def extract_instrument(page: bytes) -> tuple[int, str | None] | None:
+    # Runs in the CPU executor; None when the page has no __NEXT_DATA__ (challenge page).
+    # The script body and the currency label are sliced out of the raw page and the script
+    # is read as JSON, the full BeautifulSoup parse is only the fallback for pages laid out differently
+    next_data = scan_next_data(page)
+    if next_data is not None:
+        try:
+            stock_id = find_instrument_id(loads(next_data))
+            if stock_id is not None:
+                return stock_id, _currency_from_label(scan_element_text(page, "currency-in-label"))
+        except (ValueError, TypeError):
+            pass
+    return _extract_instrument_soup(page)
+
+
 async def get_stock_id_async(stock_url: str) -> tuple[int, str | None]:
     max_retries = 3
     retry_delays = [2, 4, 8]
     
     for attempt in range(max_retries):
         try:
-            async with AsyncSession() as client:
-                response = await client.get(
-                    stock_url, 
-                    timeout=30, 
-                    impersonate="chrome131", 
-                    headers={"Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7", "Domain-Id": "ru"}
-                )
-                data = response.text
-
-                soup = BeautifulSoup(data, "html.parser")
-                script_tag = soup.find("script", id="__NEXT_DATA__")
-                if script_tag is None:
-                    raise ValueError(f"__NEXT_DATA__ not found (status={response.status_code}, cloudflare challenge)")
-                script_data = script_tag.text
-                
-                match = re.search(r'"identifiers"\s*:\s*\{[^}]*"instrument_id"\s*:\s*"?(\d+)"?', script_data)
-                if match:
-                    stock_id = int(match.group(1))
-                else:
-                    raise ValueError("instrument_id not found in identifiers object")
+            response = await http_get(
+                stock_url, 
+                timeout=30, 
+                impersonate="chrome131", 
+                headers={"Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7", "Domain-Id": "ru"}
+            )
+            if response.status_code in THROTTLE_STATUSES:
+                raise UpstreamBlockedError(f"HTTP {response.status_code}")
+            # other error statuses (500, 502, 504...) are upstream hiccups: retried, not a block signal
+            response.raise_for_status()
 
-                currency_tag = soup.find(attrs={"data-test": "currency-in-label"})
-                currency = currency_tag.get_text(strip=True).split()[-1][1:] if currency_tag else None
+            instrument = await run_cpu(extract_instrument, response.content)
+            if instrument is None:
+                report_blocked(stock_url, "missing __NEXT_DATA__")
+                raise UpstreamBlockedError(f"__NEXT_DATA__ not found (cloudflare challenge)")
+            report_clean(stock_url)
 
-                return stock_id, currency
+            return instrument
                 
+        except UpstreamBlockedError as e:
+            logger.warning(f"Investing get_stock_id blocked: {e}. Url: {stock_url}")
+            raise
         except Exception as e:
+            report_transient(stock_url)
             if attempt < max_retries - 1:
                 delay = retry_delays[attempt]
                 logger.warning(f"Investing get_stock_id error (attempt {attempt + 1}/{max_retries}): {e}. Retrying in {delay}s... Url: {stock_url}")
+                record_retry(stock_url, delay)
                 await asyncio.sleep(delay)
             else:
                 logger.error(f"Investing get_stock_id failed after {max_retries} attempts: {e}. Url: {stock_url}")
                 raise
 
 
-async def get_stock_data_async(stock_id: int, start_date: str, end_date: str) -> list[dict]:
+async def get_stock_data_async(stock_id: int, start_date: str, end_date: str) -> list[PriceRecord]:
     url = f"https://api.investing.com/api/financialdata/historical/{stock_id}?start-date={start_date}&end-date={end_date}&time-frame=Daily&add-missing-rows=false"
 
     max_retries = 3
@@ -57,43 +101,63 @@ async def get_stock_data_async(stock_id: int, start_date: str, end_date: str) ->
     
     for attempt in range(max_retries):
         try:
-            async with AsyncSession() as client:
-                response = await client.get(
-                    url, 
-                    timeout=30, 
-                    impersonate="chrome131", 
-                    headers={"Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7", "Domain-Id": "ru"}
-                )
-
-                data = response.json().get('data', [])
-
-                if not isinstance(data, (list, tuple)):
-                    raise ValueError(f"Data is not iterable: {data}")
-
-                results = []
-                for row in data:
-                    date = row['rowDate']
-                    close_price = row['last_close']
-                    results.append({
-                        'date': date,
-                        'close_price': close_price
-                    })
-                
-                return results
+            response = await http_get(
+                url, 
+                timeout=30, 
+                impersonate="chrome131", 
+                headers={"Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7", "Domain-Id": "ru"}
+            )
+
+            if response.status_code in THROTTLE_STATUSES:
+                raise UpstreamBlockedError(f"HTTP {response.status_code}")
+            if response.status_code == 404:
+                raise StaleInstrumentError(f"instrument {stock_id} not found")
+            # other error statuses (500, 502, 504...) are upstream hiccups: retried, not a block signal
+            response.raise_for_status()
+            try:
+                payload = await run_cpu(loads, response.content, size=len(response.content))
+            except ValueError:
+                report_blocked(url, "non-JSON response")
+                raise UpstreamBlockedError(f"Non-JSON response (cloudflare challenge)")
+            report_clean(url)
+
+            return investing_history_records(payload)
                 
+        except UpstreamBlockedError as e:
+            logger.warning(f"Investing get_stock_data blocked: {e}")
+            raise
+        except StaleInstrumentError:
+            raise
         except Exception as e:
+            report_transient(url)
             if attempt < max_retries - 1:
                 delay = retry_delays[attempt]
                 logger.warning(f"Investing get_stock_data error (attempt {attempt + 1}/{max_retries}): {e}. Retrying in {delay}s...")
+                record_retry(url, delay)
                 await asyncio.sleep(delay)
             else:
                 logger.error(f"Investing get_stock_data failed after {max_retries} attempts: {e}")
                 raise
 
 
-async def get_investing_price_async(stock_url: str, target_date: str) -> tuple[float | None, str | None]:
-    stock_id, currency = await get_stock_id_async(stock_url)
-    await asyncio.sleep(0.5)
-    results = await get_stock_data_async(stock_id, target_date, target_date)
-    price = results[0].get('close_price') if results else None
+async def get_investing_price_async(stock_url: str, target_date: str, refresh: bool = False) -> tuple[float | None, str | None]:
+    entry = None
+    if not (refresh or INSTRUMENT_CACHE_REFRESH):
+        entry = await get_cached_instrument(stock_url)
+
+    if entry is None:
+        stock_id, currency = await get_stock_id_async(stock_url)
+        await store_instrument(stock_url, {'instrument_id': stock_id, 'currency': currency})
+    else:
+        stock_id, currency = entry['instrument_id'], entry.get('currency')
+
+    try:
+        results = await get_stock_data_async(stock_id, target_date, target_date)
+    except StaleInstrumentError as e:
+        if entry is None:
+            raise
+        # a cached id the API no longer knows: the page is looked up again once
+        logger.warning(f"Cached Investing instrument is stale ({e}), refreshing. Url: {stock_url}")
+        return await get_investing_price_async(stock_url, target_date, refresh=True)
+    price = results[0].close_price if results else None
     return price, currency
@@ -0,0 +1,72 @@
+import time
+import heapq
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+SLOWEST_ROWS = 10
+
+
+# Timing of one job: wall-clock stages (load, fetch, save...), time accumulated
+# across concurrent row tasks per upstream (moex, investing), event counters
+# (requests/retries per host, cache hits) and the slowest rows
+class JobStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: dict[str, float] = {}
+        self.cumulative: dict[str, float] = {}
+        self.counters: dict[str, dict[str, int]] = {}
+        # min-heap of (seconds, label), the fastest of the kept rows is dropped first
+        self.slowest: list[tuple[float, str]] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+    def add_time(self, name: str, seconds: float):
+        self.cumulative[name] = self.cumulative.get(name, 0.0) + seconds
+
+    def count(self, group: str, key: str, n: int = 1):
+        counts = self.counters.setdefault(group, {})
+        counts[key] = counts.get(key, 0) + n
+
+    def add_row_time(self, label: str, seconds: float):
+        entry = (seconds, label)
+        if len(self.slowest) < SLOWEST_ROWS:
+            heapq.heappush(self.slowest, entry)
+        elif entry > self.slowest[0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def as_dict(self) -> dict:
+        return {
+            'total': round(time.perf_counter() - self.started, 3),
+            'stages': {name: round(value, 3) for name, value in self.stages.items()},
+            'cumulative': {name: round(value, 3) for name, value in self.cumulative.items()},
+            'counters': {group: dict(counts) for group, counts in self.counters.items()},
+            'slowest': [{'row': label, 'seconds': round(seconds, 3)}
+                        for seconds, label in sorted(self.slowest, reverse=True)],
+        }
+
+
+current_job_stats: ContextVar[JobStats | None] = ContextVar('current_job_stats', default=None)
+
+
+def add_time(name: str, seconds: float):
+    stats = current_job_stats.get()
+    if stats is not None:
+        stats.add_time(name, seconds)
+
+
+def count(group: str, key: str, n: int = 1):
+    stats = current_job_stats.get()
+    if stats is not None:
+        stats.count(group, key, n)
+
+
+def add_row_time(label: str, seconds: float):
+    stats = current_job_stats.get()
+    if stats is not None:
+        stats.add_row_time(label, seconds)
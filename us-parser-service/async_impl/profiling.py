@@ -0,0 +1,231 @@
+import os
+import sys
+import json
+import asyncio
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# A job runs under the sampling profiler when its job entry has profile=1 (/parse profile
+# in the bot), when PROFILE_JOBS=1, or while the <prefix>:enabled key exists in Redis.
+# Samples are only counted while a task of that job is running on the event loop or a CPU
+# pool thread is running work handed off by it, so concurrent jobs stay out of its profile
+PROFILE_JOBS = os.getenv('PROFILE_JOBS', '0') == '1'
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', 0.005))
+PROFILE_TTL = int(os.getenv('PROFILE_TTL', 7 * 24 * 3600))
+# tracemalloc is process-wide: allocations of jobs running at the same time are included and
+# allocation-heavy code of every job runs several times slower while it is on, so it is opt-in
+# and its section of the profile is marked as worker-wide; only the allocating line is recorded
+PROFILE_TRACEMALLOC = os.getenv('PROFILE_TRACEMALLOC', '0') == '1'
+PROFILE_TRACEMALLOC_FRAMES = 1
+PROFILE_TOP = 30
+PROFILE_MAX_STACKS = 500
+PROFILE_TOGGLE = 'enabled'
+
+_redis = None
+_key_prefix = None
+_profiled_job: ContextVar[str | None] = ContextVar('profiled_job', default=None)
+_tracemalloc_users = 0
+# CPU pool thread ident -> profiled job whose work it is running
+_pool_threads: dict[int, str] = {}
+
+
+def profiling_active() -> bool:
+    # true inside the tasks of a profiled job
+    return _profiled_job.get() is not None
+
+
+def tag_pool_call(call):
+    # Wraps work handed to the CPU thread pool by a profiled job, so the sampler follows it there
+    job_id = _profiled_job.get()
+    if job_id is None:
+        return call
+
+    def run():
+        ident = threading.get_ident()
+        _pool_threads[ident] = job_id
+        try:
+            return call()
+        finally:
+            _pool_threads.pop(ident, None)
+    return run
+
+
+def configure_profiling(redis_client, key_prefix: str):
+    global _redis, _key_prefix
+    _redis = redis_client
+    _key_prefix = key_prefix
+
+
+async def should_profile(job_data: dict) -> bool:
+    if job_data.get('profile') == '1' or PROFILE_JOBS:
+        return True
+    if _redis is None:
+        return False
+    try:
+        return bool(await _redis.exists(f"{_key_prefix}:{PROFILE_TOGGLE}"))
+    except Exception as e:
+        logger.warning(f"Profiling toggle read failed: {e}")
+        return False
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.stacks: Counter[tuple[str, ...]] = Counter()
+        self.job_samples = 0
+        self.pool_samples = 0
+        self.other_task_samples = 0
+        self.idle_samples = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'profiler-{job_id}', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _owner(self) -> str:
+        task = asyncio.current_task(self.loop)
+        if task is None:
+            # the loop is waiting on sockets or running callbacks outside of tasks
+            return 'idle'
+        get_context = getattr(task, 'get_context', None)
+        if get_context is None:
+            # Task.get_context() needs Python 3.12, older interpreters attribute every task
+            return 'job'
+        return 'job' if get_context().get(_profiled_job) == self.job_id else 'other'
+
+    def _record(self, frame):
+        stack = []
+        while frame is not None:
+            stack.append(_frame_name(frame))
+            frame = frame.f_back
+        self.stacks[tuple(reversed(stack))] += 1
+        self.job_samples += 1
+
+    def _run(self):
+        while not self._stopped.wait(PROFILE_INTERVAL):
+            frames = sys._current_frames()
+            for ident, job_id in list(_pool_threads.items()):
+                if job_id == self.job_id and ident in frames:
+                    self._record(frames[ident])
+                    self.pool_samples += 1
+
+            frame = frames.get(self.loop_thread)
+            if frame is None:
+                continue
+            owner = self._owner()
+            if owner == 'idle':
+                self.idle_samples += 1
+            elif owner == 'other':
+                self.other_task_samples += 1
+            else:
+                self._record(frame)
+
+    def summary(self) -> dict:
+        own, total = Counter(), Counter()
+        for stack, samples in self.stacks.items():
+            own[stack[-1]] += samples
+            for name in set(stack):
+                total[name] += samples
+
+        def top(counter: Counter) -> list[dict]:
+            return [{'function': name, 'samples': samples, 'share': round(samples / self.job_samples, 3)}
+                    for name, samples in counter.most_common(PROFILE_TOP)]
+
+        return {
+            'interval': PROFILE_INTERVAL,
+            'samples': {'job': self.job_samples, 'cpu_pool': self.pool_samples, 'other_jobs': self.other_task_samples, 'idle': self.idle_samples},
+            'top_self': top(own),
+            'top_total': top(total),
+            # collapsed stacks, the input format of flamegraph.pl / speedscope
+            'folded': '\n'.join(f"{';'.join(stack)} {samples}"
+                                for stack, samples in self.stacks.most_common(PROFILE_MAX_STACKS)),
+        }
+
+
+def _start_tracemalloc() -> tracemalloc.Snapshot | None:
+    global _tracemalloc_users
+    if not PROFILE_TRACEMALLOC:
+        return None
+    if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+        tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+    _tracemalloc_users += 1
+    return tracemalloc.take_snapshot()
+
+
+def _stop_tracemalloc(started: tracemalloc.Snapshot | None) -> dict | None:
+    global _tracemalloc_users
+    if started is None:
+        return None
+
+    ignored = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+    ]
+    finished = tracemalloc.take_snapshot().filter_traces(ignored)
+    _, peak = tracemalloc.get_traced_memory()
+    _tracemalloc_users -= 1
+    if _tracemalloc_users == 0:
+        tracemalloc.stop()
+
+    top = finished.compare_to(started.filter_traces(ignored), 'lineno')[:PROFILE_TOP]
+    return {
+        'scope': 'worker',
+        'peak_mb': round(peak / 1024 / 1024, 1),
+        'top_allocations': [
+            {
+                'site': str(stat.traceback[0]),
+                'size_kb': round(stat.size / 1024, 1),
+                'size_diff_kb': round(stat.size_diff / 1024, 1),
+                'count_diff': stat.count_diff,
+            }
+            for stat in top
+        ],
+    }
+
+
+async def _store_profile(job_id: str, profile: dict):
+    if _redis is None:
+        return
+    try:
+        await _redis.set(f"{_key_prefix}:{job_id}", json.dumps(profile), ex=PROFILE_TTL)
+        logger.info(f"Profile of job {job_id} stored in {_key_prefix}:{job_id}")
+    except Exception as e:
+        logger.warning(f"Could not store the profile of job {job_id}: {e}")
+
+
+@asynccontextmanager
+async def profile_job(job_id: str, user_id: str, enabled: bool):
+    if not enabled:
+        yield
+        return
+
+    logger.info(f"Profiling job {job_id} (sampling every {PROFILE_INTERVAL * 1000:.0f} ms)")
+    token = _profiled_job.set(job_id)
+    memory_before = _start_tracemalloc()
+    profiler = SamplingProfiler(job_id)
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        _profiled_job.reset(token)
+        profile = {'job_id': job_id, 'user_id': user_id, **profiler.summary()}
+        profile['memory'] = _stop_tracemalloc(memory_before)
+        await _store_profile(job_id, profile)
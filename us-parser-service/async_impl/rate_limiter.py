@@ -0,0 +1,118 @@
+import os
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+INVESTING_RATE_INITIAL = float(os.getenv('INVESTING_RATE_INITIAL', 2.0))
+INVESTING_RATE_MIN = float(os.getenv('INVESTING_RATE_MIN', 0.2))
+INVESTING_RATE_MAX = float(os.getenv('INVESTING_RATE_MAX', 10.0))
+INVESTING_RATE_STEP = float(os.getenv('INVESTING_RATE_STEP', 0.1))
+INVESTING_WINDOW_INITIAL = float(os.getenv('INVESTING_WINDOW_INITIAL', 5))
+INVESTING_WINDOW_MAX = float(os.getenv('INVESTING_WINDOW_MAX', 20))
+INVESTING_BACKOFF_FACTOR = float(os.getenv('INVESTING_BACKOFF_FACTOR', 0.5))
+
+THROTTLE_STATUSES = {403, 429, 503}
+
+
+# Token bucket with AIMD control of both the request rate and the in-flight window:
+# clean responses grow them additively, throttling signals cut them multiplicatively
+class AdaptiveRateLimiter:
+    def __init__(self, host: str, rate: float, min_rate: float, max_rate: float, step: float,
+                 window: float, max_window: float, backoff_factor: float):
+        self.host = host
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.step = step
+        self.window = window
+        self.max_window = max_window
+        self.backoff_factor = backoff_factor
+
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.in_flight = 0
+        self.successes = 0
+        self.backoffs = 0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(max(self.rate, 1.0), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1 and self.in_flight < int(self.window):
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    return
+                if self.tokens < 1:
+                    await asyncio.sleep((1 - self.tokens) / self.rate)
+                else:
+                    await asyncio.sleep(0.05)
+
+    def release(self):
+        self.in_flight -= 1
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+    def on_success(self):
+        self.successes += 1
+        self.rate = min(self.max_rate, self.rate + self.step)
+        self.window = min(self.max_window, self.window + 1 / self.window)
+
+    def on_throttle(self, reason: str):
+        self.backoffs += 1
+        self.rate = max(self.min_rate, self.rate * self.backoff_factor)
+        self.window = max(1.0, self.window * self.backoff_factor)
+        self.tokens = 0.0
+        logger.warning(
+            f"Rate limiter {self.host}: back-off #{self.backoffs} ({reason}), "
+            f"rate={self.rate:.2f} req/s, window={int(self.window)}"
+        )
+
+    def stats(self) -> dict:
+        return {
+            'host': self.host,
+            'rate': round(self.rate, 3),
+            'window': int(self.window),
+            'in_flight': self.in_flight,
+            'successes': self.successes,
+            'backoffs': self.backoffs,
+        }
+
+
+_limiters: dict[str, AdaptiveRateLimiter] = {}
+
+
+def get_limiter(host: str) -> AdaptiveRateLimiter | None:
+    if not host.endswith('investing.com'):
+        return None
+
+    limiter = _limiters.get(host)
+    if limiter is None:
+        limiter = AdaptiveRateLimiter(
+            host,
+            rate=INVESTING_RATE_INITIAL,
+            min_rate=INVESTING_RATE_MIN,
+            max_rate=INVESTING_RATE_MAX,
+            step=INVESTING_RATE_STEP,
+            window=INVESTING_WINDOW_INITIAL,
+            max_window=INVESTING_WINDOW_MAX,
+            backoff_factor=INVESTING_BACKOFF_FACTOR,
+        )
+        _limiters[host] = limiter
+    return limiter
+
+
+def limiter_stats() -> list[dict]:
+    return [limiter.stats() for limiter in _limiters.values()]
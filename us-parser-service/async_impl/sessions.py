@@ -0,0 +1,123 @@
+import os
+import time
+import logging
+from urllib.parse import urlsplit, urlunsplit
+from curl_cffi import CurlHttpVersion
+from curl_cffi.requests import AsyncSession
+
+from .rate_limiter import get_limiter, THROTTLE_STATUSES
+from .distributed_limiter import acquire_distributed
+from .circuit_breaker import get_breaker
+from .metrics import observe_request, record_block
+
+logger = logging.getLogger(__name__)
+
+SESSION_MAX_CLIENTS = int(os.getenv('SESSION_MAX_CLIENTS', 10))
+# HTTP/2 is negotiated via ALPN, hosts without h2 support stay on HTTP/1.1
+SESSION_HTTP2 = os.getenv('SESSION_HTTP2', '1') == '1'
+# Base URL of a local stand-in (adhoc/upstream_stub.py) that receives every upstream request;
+# the original host is passed in the X-Upstream-Host header
+UPSTREAM_OVERRIDE = os.getenv('UPSTREAM_OVERRIDE')
+
+_sessions: dict[str, AsyncSession] = {}
+
+
+def get_session(url: str) -> AsyncSession:
+    host = urlsplit(url).hostname
+    session = _sessions.get(host)
+    if session is None:
+        session = AsyncSession(
+            max_clients=SESSION_MAX_CLIENTS,
+            http_version=CurlHttpVersion.V2TLS if SESSION_HTTP2 else CurlHttpVersion.V1_1,
+        )
+        _sessions[host] = session
+        logger.info(f"Opened HTTP session pool for {host} (max {SESSION_MAX_CLIENTS} connections)")
+    return session
+
+
+def _resolve(url: str, kwargs: dict) -> str:
+    if not UPSTREAM_OVERRIDE:
+        return url
+
+    parts = urlsplit(url)
+    override = urlsplit(UPSTREAM_OVERRIDE)
+    kwargs['headers'] = {**(kwargs.get('headers') or {}), 'X-Upstream-Host': parts.hostname}
+    return urlunsplit((override.scheme, override.netloc, parts.path, parts.query, ''))
+
+
+async def _timed_get(host: str, url: str, request_url: str, **kwargs):
+    started = time.perf_counter()
+    try:
+        response = await get_session(url).get(request_url, **kwargs)
+    except Exception:
+        observe_request(host, time.perf_counter() - started)
+        raise
+    observe_request(host, time.perf_counter() - started, response.status_code)
+    return response
+
+
+async def http_get(url: str, **kwargs):
+    host = urlsplit(url).hostname
+    request_url = _resolve(url, kwargs)
+    limiter = get_limiter(host)
+    breaker = get_breaker(host)
+    if limiter is None or breaker is None:
+        await acquire_distributed(host)
+        return await _timed_get(host, url, request_url, **kwargs)
+
+    is_probe = await breaker.acquire()
+    # A probe that raises (timeout, connection error, cancellation) or gets an error status
+    # is released here; only a 2xx response is left to the caller's report_clean / report_blocked
+    handed_over = False
+    try:
+        async with limiter:
+            await acquire_distributed(host)
+            response = await _timed_get(host, url, request_url, **kwargs)
+
+        if response.status_code in THROTTLE_STATUSES:
+            report_blocked(url, f"HTTP {response.status_code}")
+        handed_over = response.status_code < 400
+        return response
+    finally:
+        if is_probe and not handed_over:
+            breaker.probe_failed()
+
+
+# Callers classify the response content: a usable page or a genuinely empty result is
+# clean, a challenge page is a block signal, anything else is transient and not reported
+def report_clean(url: str):
+    host = urlsplit(url).hostname
+    limiter = get_limiter(host)
+    if limiter is not None:
+        limiter.on_success()
+    breaker = get_breaker(host)
+    if breaker is not None:
+        breaker.record_success()
+
+
+def report_transient(url: str):
+    # A failure that says nothing about blocking; releases a half-open probe so the next request probes
+    breaker = get_breaker(urlsplit(url).hostname)
+    if breaker is not None:
+        breaker.probe_failed()
+
+
+def report_blocked(url: str, reason: str):
+    host = urlsplit(url).hostname
+    record_block(host)
+    limiter = get_limiter(host)
+    if limiter is not None:
+        limiter.on_throttle(reason)
+    breaker = get_breaker(host)
+    if breaker is not None:
+        breaker.record_block(reason)
+
+
+async def close_sessions():
+    sessions = list(_sessions.items())
+    _sessions.clear()
+    for host, session in sessions:
+        try:
+            await session.close()
+        except Exception as e:
+            logger.warning(f"Error closing HTTP session for {host}: {e}")
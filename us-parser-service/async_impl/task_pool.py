@@ -0,0 +1,27 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable
+
+
+async def run_pool(items: Iterable, concurrency: int,
+                   func: Callable[[int, Any], Awaitable]) -> AsyncIterator[tuple[int, Any]]:
+    # Keeps `concurrency` calls in flight and yields (index, result) as soon as each call
+    # finishes; a raised exception is yielded in place of the result
+    pending = list(enumerate(items))
+    source = iter(pending)
+    results = asyncio.Queue()
+
+    async def worker():
+        for index, item in source:
+            try:
+                result = await func(index, item)
+            except Exception as e:
+                result = e
+            await results.put((index, result))
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(pending)))]
+    try:
+        for _ in range(len(pending)):
+            yield await results.get()
+    finally:
+        for task in workers:
+            task.cancel()
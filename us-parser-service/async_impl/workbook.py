@@ -0,0 +1,348 @@
+import io
+import os
+import re
+import copy
+import math
+import struct
+import zipfile
+import logging
+import posixpath
+from collections import deque
+from xml.sax.saxutils import escape, unescape
+import openpyxl
+from openpyxl.utils import get_column_letter, column_index_from_string
+
+logger = logging.getLogger(__name__)
+
+# Patch result cells straight into the sheet XML; openpyxl is only used when the layout is unsupported
+XLSX_PATCH_WRITER = os.getenv('XLSX_PATCH_WRITER', '1') == '1'
+
+# The lookahead captures the reference so untouched rows and cells are never parsed further
+ROW_RE = re.compile(r'<row\b(?=[^>]*?\sr="(\d+)")?[^>]*?(?:/>|>.*?</row>)', re.S)
+CELL_RE = re.compile(r'<c\b(?=[^>]*?\sr="([A-Z]+)\d+")?[^>]*?(?:/>|>.*?</c>)', re.S)
+ATTR_RE = re.compile(r'([\w:.-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+PLAIN_SI_RE = re.compile(r'<si><t(?: xml:space="preserve")?>([^<]*)</t></si>')
+SHARED_STRINGS = 'xl/sharedStrings.xml'
+CALC_CHAIN = 'xl/calcChain.xml'
+# Fixed part of a zip local file header, the name and extra field lengths are its last two fields
+LOCAL_HEADER_SIZE = 30
+DATA_DESCRIPTOR_FLAG = 0x08
+
+
+class UnsupportedWorkbookError(Exception):
+    pass
+
+
+def iter_sheet_rows(file_content: bytes, max_col: int, min_row: int = 1):
+    # Read-only parse streams rows out of the sheet XML without building cell objects,
+    # so memory stays flat regardless of the workbook size
+    wb = openpyxl.load_workbook(io.BytesIO(file_content), read_only=True)
+    try:
+        rows = wb.active.iter_rows(min_row=min_row, max_col=max_col, values_only=True)
+        for row_num, values in enumerate(rows, start=min_row):
+            yield row_num, values + (None,) * (max_col - len(values))
+    finally:
+        wb.close()
+
+
+def read_cell(file_content: bytes, row: int, col: int):
+    for _, values in iter_sheet_rows(file_content, col, min_row=row):
+        return values[col - 1]
+    return None
+
+
+def write_cells(file_content: bytes, cells: dict[tuple[int, int], object]) -> bytes:
+    # cells maps (row, column) to the new value; everything else is left as uploaded
+    if XLSX_PATCH_WRITER:
+        try:
+            return patch_cells(file_content, cells)
+        except UnsupportedWorkbookError as e:
+            logger.info(f"Workbook layout not supported by the XML patcher ({e}), saving with openpyxl")
+        except Exception as e:
+            logger.warning(f"XML patching failed ({e}), saving with openpyxl")
+
+    wb = openpyxl.load_workbook(io.BytesIO(file_content))
+    ws = wb.active
+    for (row, col), value in cells.items():
+        ws.cell(row, col).value = value
+
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+def _attrs(tag: str) -> dict[str, str]:
+    attrs = {}
+    for name, double, single in ATTR_RE.findall(tag):
+        value = double or single
+        attrs[name] = unescape(value, {'&quot;': '"'}) if '&' in value else value
+    return attrs
+
+
+def _start_tag(name: str, attrs: dict[str, str], empty: bool = False) -> str:
+    rendered = ''.join(f' {key}="{escape(value, {chr(34): "&quot;"})}"' for key, value in attrs.items())
+    return f"<{name}{rendered}{'/' if empty else ''}>"
+
+
+def _text(value: str) -> str:
+    space = ' xml:space="preserve"' if value != value.strip() else ''
+    return f"<t{space}>{escape(value)}</t>"
+
+
+class _SharedStrings:
+    def __init__(self, xml: str | None):
+        self.xml = xml
+        self.added: list[str] = []
+        self.references = 0
+        self.index: dict[str, int] = {}
+        if xml is None:
+            return
+
+        if not xml.rstrip().endswith('</sst>'):
+            raise UnsupportedWorkbookError("unexpected sharedStrings layout")
+        self.count = len(re.findall(r'<si\b', xml))
+        for position, match in enumerate(re.finditer(r'<si\b[^>]*/>|<si\b.*?</si>', xml, re.S)):
+            plain = PLAIN_SI_RE.fullmatch(match.group(0))
+            if plain is not None:
+                self.index.setdefault(unescape(plain.group(1)), position)
+
+    def get(self, value: str) -> int | None:
+        if self.xml is None:
+            return None
+        position = self.index.get(value)
+        if position is None:
+            position = self.count + len(self.added)
+            self.index[value] = position
+            self.added.append(value)
+        self.references += 1
+        return position
+
+    def render(self) -> str | None:
+        if self.xml is None or not self.references:
+            return None
+
+        head, _, tail = self.xml.rpartition('</sst>')
+        head += ''.join(f"<si>{_text(value)}</si>" for value in self.added)
+        sst_start = re.search(r'<sst\b[^>]*>', head)
+        attrs = _attrs(sst_start.group(0))
+        if 'uniqueCount' in attrs:
+            attrs['uniqueCount'] = str(self.count + len(self.added))
+        if 'count' in attrs:
+            attrs['count'] = str(int(attrs['count']) + self.references)
+        head = head[:sst_start.start()] + _start_tag('sst', attrs) + head[sst_start.end():]
+        return head + '</sst>' + tail
+
+
+def _render_cell(ref: str, value, style: str | None, shared: _SharedStrings) -> str:
+    attrs = {'r': ref}
+    if style is not None:
+        attrs['s'] = style
+
+    if value is None:
+        return _start_tag('c', attrs, empty=True)
+    if isinstance(value, bool):
+        attrs['t'] = 'b'
+        return f"{_start_tag('c', attrs)}<v>{int(value)}</v></c>"
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and not math.isfinite(value):
+            raise UnsupportedWorkbookError(f"non-finite number for {ref}")
+        return f"{_start_tag('c', attrs)}<v>{value!r}</v></c>"
+    if isinstance(value, str):
+        position = shared.get(value)
+        if position is None:
+            attrs['t'] = 'inlineStr'
+            return f"{_start_tag('c', attrs)}<is>{_text(value)}</is></c>"
+        attrs['t'] = 's'
+        return f"{_start_tag('c', attrs)}<v>{position}</v></c>"
+    raise UnsupportedWorkbookError(f"unsupported value type {type(value).__name__} for {ref}")
+
+
+def _patch_row(row_xml: str, row_num: int, updates: dict[int, object], shared: _SharedStrings,
+               has_calc_chain: bool) -> str:
+    start_tag = re.match(r'<row\b[^>]*?/?>', row_xml).group(0)
+    row_attrs = _attrs(start_tag)
+    # spans is only an optimisation hint and may no longer cover the written cells
+    row_attrs.pop('spans', None)
+    body = '' if start_tag.endswith('/>') else row_xml[len(start_tag):-len('</row>')]
+
+    pieces = []
+    pending = deque(sorted(updates.items()))
+    position = 0
+    for match in CELL_RE.finditer(body):
+        if not pending:
+            break
+        if match.group(1) is None:
+            raise UnsupportedWorkbookError(f"cell without reference in row {row_num}")
+        col = column_index_from_string(match.group(1))
+        if col < pending[0][0]:
+            continue
+
+        pieces.append(body[position:match.start()])
+        position = match.end()
+        while pending and pending[0][0] < col:
+            new_col, value = pending.popleft()
+            pieces.append(_render_cell(f"{get_column_letter(new_col)}{row_num}", value, None, shared))
+
+        cell_xml = match.group(0)
+        if pending and pending[0][0] == col:
+            ref = f"{match.group(1)}{row_num}"
+            if '<f' in cell_xml and (has_calc_chain or re.search(r'<f\b[^>]*\bt="(?:shared|array)"', cell_xml)):
+                raise UnsupportedWorkbookError(f"formula in {ref}")
+            _, value = pending.popleft()
+            style = _attrs(re.match(r'<c\b[^>]*?/?>', cell_xml).group(0)).get('s')
+            pieces.append(_render_cell(ref, value, style, shared))
+        else:
+            pieces.append(cell_xml)
+    pieces.append(body[position:])
+
+    for new_col, value in pending:
+        pieces.append(_render_cell(f"{get_column_letter(new_col)}{row_num}", value, None, shared))
+
+    return f"{_start_tag('row', row_attrs)}{''.join(pieces)}</row>"
+
+
+def _new_row(row_num: int, updates: dict[int, object], shared: _SharedStrings) -> str:
+    cells = ''.join(_render_cell(f"{get_column_letter(col)}{row_num}", value, None, shared)
+                    for col, value in sorted(updates.items()))
+    return f'<row r="{row_num}">{cells}</row>'
+
+
+def _patch_dimension(sheet_xml: str, max_row: int, max_col: int) -> str:
+    match = re.search(r'<dimension\b[^>]*?\bref="([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?"[^>]*/>', sheet_xml)
+    if match is None:
+        return sheet_xml
+
+    first_col, first_row, last_col, last_row = match.groups()
+    last_col = max(column_index_from_string(last_col or first_col), max_col)
+    last_row = max(int(last_row or first_row), max_row)
+    ref = f"{first_col}{first_row}:{get_column_letter(last_col)}{last_row}"
+    return f'{sheet_xml[:match.start()]}<dimension ref="{ref}"/>{sheet_xml[match.end():]}'
+
+
+def _patch_sheet(sheet_xml: str, cells: dict[tuple[int, int], object], shared: _SharedStrings,
+                 has_calc_chain: bool) -> str:
+    by_row: dict[int, dict[int, object]] = {}
+    for (row, col), value in cells.items():
+        by_row.setdefault(row, {})[col] = value
+
+    empty = re.search(r'<sheetData\s*/>', sheet_xml)
+    if empty is not None:
+        head, body, tail = sheet_xml[:empty.start()] + '<sheetData>', '', '</sheetData>' + sheet_xml[empty.end():]
+    else:
+        start = re.search(r'<sheetData\b[^>]*>', sheet_xml)
+        end = sheet_xml.rfind('</sheetData>')
+        if start is None or end < 0:
+            raise UnsupportedWorkbookError("sheetData not found")
+        head, body, tail = sheet_xml[:start.end()], sheet_xml[start.end():end], sheet_xml[end:]
+
+    pieces = []
+    pending_rows = deque(sorted(by_row))
+    position = 0
+    for match in ROW_RE.finditer(body):
+        if not pending_rows:
+            break
+        if match.group(1) is None:
+            raise UnsupportedWorkbookError("row without reference")
+        row_num = int(match.group(1))
+        if row_num < pending_rows[0]:
+            continue
+
+        pieces.append(body[position:match.start()])
+        position = match.end()
+        while pending_rows and pending_rows[0] < row_num:
+            new_row = pending_rows.popleft()
+            pieces.append(_new_row(new_row, by_row[new_row], shared))
+
+        if pending_rows and pending_rows[0] == row_num:
+            pending_rows.popleft()
+            pieces.append(_patch_row(match.group(0), row_num, by_row[row_num], shared, has_calc_chain))
+        else:
+            pieces.append(match.group(0))
+    pieces.append(body[position:])
+
+    for new_row in pending_rows:
+        pieces.append(_new_row(new_row, by_row[new_row], shared))
+
+    patched = head + ''.join(pieces) + tail
+    return _patch_dimension(patched, max(by_row), max(col for _, col in cells))
+
+
+def _active_sheet_path(archive: zipfile.ZipFile) -> str:
+    workbook_xml = archive.read('xl/workbook.xml').decode('utf-8')
+    active = re.search(r'<workbookView\b[^>]*?\bactiveTab="(\d+)"', workbook_xml)
+    sheets = re.findall(r'<sheet\b[^>]*>', workbook_xml)
+    if not sheets:
+        raise UnsupportedWorkbookError("no sheets in workbook.xml")
+    sheet_attrs = _attrs(sheets[int(active.group(1)) if active else 0])
+    rel_id = next((value for key, value in sheet_attrs.items() if key.endswith(':id')), None)
+
+    rels_xml = archive.read('xl/_rels/workbook.xml.rels').decode('utf-8')
+    for relationship in re.findall(r'<Relationship\b[^>]*>', rels_xml):
+        rel_attrs = _attrs(relationship)
+        if rel_attrs.get('Id') != rel_id:
+            continue
+        if not rel_attrs.get('Type', '').endswith('/worksheet'):
+            raise UnsupportedWorkbookError("active sheet is not a worksheet")
+        target = rel_attrs['Target']
+        return target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+    raise UnsupportedWorkbookError("active sheet relationship not found")
+
+
+def _force_recalculation(workbook_xml: str) -> str:
+    # Cached results of formulas that depend on the written cells are stale now
+    calc = re.search(r'<calcPr\b[^>]*?/>', workbook_xml)
+    if calc is None or 'fullCalcOnLoad=' in calc.group(0):
+        return workbook_xml
+    patched = calc.group(0)[:-2].rstrip() + ' fullCalcOnLoad="1"/>'
+    return workbook_xml[:calc.start()] + patched + workbook_xml[calc.end():]
+
+
+def _copy_member(result: zipfile.ZipFile, info: zipfile.ZipInfo, file_content: bytes):
+    # Copies the compressed bytes of a member as they are, the local header is rebuilt from
+    # the central directory entry (sizes and CRC known up front, so no data descriptor)
+    name_len, extra_len = struct.unpack_from('<HH', file_content, info.header_offset + LOCAL_HEADER_SIZE - 4)
+    start = info.header_offset + LOCAL_HEADER_SIZE + name_len + extra_len
+    member = copy.copy(info)
+    member.flag_bits &= ~DATA_DESCRIPTOR_FLAG
+    # FileHeader writes its own zip64 field when the sizes need one
+    member.extra = b''
+    member.header_offset = result.fp.tell()
+    result.fp.write(member.FileHeader())
+    result.fp.write(file_content[start:start + info.compress_size])
+    result.filelist.append(member)
+    result.NameToInfo[member.filename] = member
+    result.start_dir = result.fp.tell()
+
+
+def patch_cells(file_content: bytes, cells: dict[tuple[int, int], object]) -> bytes:
+    # Rewrites only the affected <c> elements of the active sheet (plus sharedStrings and the
+    # recalculation flag), every other zip member is copied through still compressed
+    if not cells:
+        return file_content
+
+    with zipfile.ZipFile(io.BytesIO(file_content)) as archive:
+        names = set(archive.namelist())
+        sheet_path = _active_sheet_path(archive)
+        if sheet_path not in names:
+            raise UnsupportedWorkbookError(f"{sheet_path} missing")
+
+        shared = _SharedStrings(archive.read(SHARED_STRINGS).decode('utf-8') if SHARED_STRINGS in names else None)
+        sheet_xml = _patch_sheet(archive.read(sheet_path).decode('utf-8'), cells, shared, CALC_CHAIN in names)
+
+        patched = {
+            sheet_path: sheet_xml.encode('utf-8'),
+            'xl/workbook.xml': _force_recalculation(archive.read('xl/workbook.xml').decode('utf-8')).encode('utf-8'),
+        }
+        shared_xml = shared.render()
+        if shared_xml is not None:
+            patched[SHARED_STRINGS] = shared_xml.encode('utf-8')
+
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as result:
+            for info in archive.infolist():
+                data = patched.get(info.filename)
+                if data is not None:
+                    result.writestr(info, data)
+                else:
+                    _copy_member(result, info, file_content)
+        return output.getvalue()
@@ -1,17 +1,32 @@
 #!/usr/bin/env python3
 import os
 import sys
+import json
+import signal
+import socket
+import time
+import random
 import asyncio
 import logging
 import redis.asyncio as redis
-from pathlib import Path
 from datetime import datetime
+from contextlib import aclosing
+from dataclasses import dataclass, astuple
 import traceback
-import openpyxl
-import xml.etree.ElementTree as ET
-from curl_cffi.requests import AsyncSession
 
-from async_impl import get_investing_price_async
+from async_impl import (
+    get_investing_price_async,
+    UpstreamBlockedError, configure_instrument_cache, configure_distributed_limiter, configure_price_cache,
+    get_cached_price, store_price, canonicalize_url, http_get, close_sessions, limiter_stats, breaker_stats,
+    run_pool, JobStats, current_job_stats, add_time, add_row_time, iter_sheet_rows, read_cell, write_cells,
+    configure_checkpoints, load_checkpoint, save_checkpoint, clear_checkpoint, claim_stale_messages, keep_claimed,
+    JOB_CLAIM_IDLE, JOB_MAX_DELIVERIES, configure_sharding, should_shard, run_sharded, consume_shards,
+    pack_payload, unpack_payload, drop_payload, trim_acked, decode_fields, STREAM_MAXLEN,
+    start_metrics_server, monitor_queues, monitor_loop_lag, record_retry, record_row, observe_job, observe_fetch_rate,
+    configure_profiling, should_profile, profile_job, run_cpu, iter_cpu, close_executor, run_event_loop,
+    record_loop_stall, start_loop_watchdog, decode_cbr_rates,
+    configure_trading_calendar, resolve_trading_date
+)
 
 
 logging.basicConfig(
@@ -28,11 +43,31 @@ REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
 JOBS_STREAM = 'us_parser:jobs'
 RESULTS_STREAM = 'us_parser:results'
 CONSUMER_GROUP = 'us_parser_service'
+INSTRUMENT_CACHE_PREFIX = 'us_parser:instrument'
+PRICE_CACHE_PREFIX = 'us_parser:price'
+SHARDS_STREAM = 'us_parser:shards'
+CHECKPOINT_PREFIX = 'us_parser:checkpoint'
+BLOB_PREFIX = 'us_parser:blob'
+REPORT_PREFIX = 'us_parser:report'
+PROFILE_PREFIX = 'us_parser:profile'
+CALENDAR_PREFIX = 'us_parser:calendar'
+# exchange calendar the job date is checked against before fetching
+TRADING_EXCHANGE = 'nyse'
 BATCH_SIZE = int(os.getenv('BATCH_SIZE', 5))
 INVESTING_MAX_RETRIES = int(os.getenv('INVESTING_MAX_RETRIES', 3))
 INVESTING_RETRY_DELAY = float(os.getenv('INVESTING_RETRY_DELAY', 2.0))
+# Jobs processed at the same time; they share the per-host limiters and HTTP sessions
+MAX_CONCURRENT_JOBS = int(os.getenv('MAX_CONCURRENT_JOBS', 3))
+# Stable across container restarts, so the worker picks its own pending jobs up again
+CONSUMER_NAME = os.getenv('CONSUMER_NAME', f'worker-{socket.gethostname()}')
+# How long SIGTERM waits for running jobs; unfinished ones resume from their checkpoints
+DRAIN_TIMEOUT = float(os.getenv('DRAIN_TIMEOUT', 25))
+# Per-job performance reports are kept this long for /report in the bot
+JOB_REPORT_TTL = int(os.getenv('JOB_REPORT_TTL', 7 * 24 * 3600))
 
 redis_client = None
+# Job payloads are raw bytes, so the job stream is read without response decoding
+binary_redis_client = None
 
 
 async def get_redis():
@@ -46,6 +81,17 @@ async def get_redis():
     return redis_client
 
 
+async def get_binary_redis():
+    global binary_redis_client
+    if binary_redis_client is None:
+        binary_redis_client = redis.Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            decode_responses=False
+        )
+    return binary_redis_client
+
+
 def format_date_for_api(date: datetime) -> str:
     return date.strftime('%Y-%m-%d')
 
@@ -79,25 +125,11 @@ async def get_currency_rates_from_cbr(date: datetime, currency_codes: set[str])
         date_str = date.strftime('%d/%m/%Y')
         url = f"https://cbr.ru/scripts/XML_daily.asp?date_req={date_str}"
 
-        async with AsyncSession() as client:
-            response = await client.get(url, timeout=30, impersonate="chrome120")
-            response.raise_for_status()
-
-            root = ET.fromstring(response.content)
-
-            rates = {}
-            for valute in root.findall('Valute'):
-                char_code = valute.find('CharCode')
-                if char_code is None or char_code.text not in currency_codes:
-                    continue
-                nominal_el = valute.find('Nominal')
-                value_el = valute.find('Value')
-                if value_el is not None and value_el.text:
-                    nominal = int(nominal_el.text) if nominal_el is not None and nominal_el.text else 1
-                    rate = float(value_el.text.replace(',', '.')) / nominal
-                    rates[char_code.text] = rate
-
-            return rates
+        response = await http_get(url, timeout=30, impersonate="chrome120")
+        response.raise_for_status()
+
+        rates = await run_cpu(decode_cbr_rates, response.content, size=len(response.content))
+        return {code: rate for code, rate in rates.items() if code in currency_codes}
     except Exception as e:
         logger.error(f"Error fetching currency rates from CBR: {e}")
         return {}
@@ -108,19 +140,33 @@ async def process_single_stock_async(row_num: int, stock_name: str, investing_ur
     investing_price = None
     currency = None
 
-    if investing_url:
+    investing_started = time.perf_counter()
+    cached = await get_cached_price('investing', canonicalize_url(investing_url), target_date) if investing_url else None
+    if cached is not None:
+        investing_price = cached['close']
+        currency = cached['currency']
+    elif investing_url:
         for attempt in range(INVESTING_MAX_RETRIES):
             try:
                 investing_price, currency = await get_investing_price_async(investing_url, target_date)
-                if investing_price is not None:
-                    break
+                if investing_price is None:
+                    logger.warning(f"  [{index}] {stock_name} - Investing.com has no data for {target_date}")
+                break
+            except UpstreamBlockedError as e:
                 if attempt < INVESTING_MAX_RETRIES - 1:
-                    delay = INVESTING_RETRY_DELAY * (2 ** attempt)
+                    # full jitter, so rows blocked together don't come back in lockstep
+                    delay = random.uniform(0, INVESTING_RETRY_DELAY * (2 ** attempt))
                     logger.warning(
-                        f"  [{index}] {stock_name} - Investing.com returned None, "
-                        f"retrying in {delay}s (attempt {attempt + 1}/{INVESTING_MAX_RETRIES})"
+                        f"  [{index}] {stock_name} - Investing.com blocked: {e}, "
+                        f"retrying in {delay:.1f}s (attempt {attempt + 1}/{INVESTING_MAX_RETRIES})"
                     )
+                    record_retry(investing_url, delay)
                     await asyncio.sleep(delay)
+                else:
+                    logger.error(
+                        f"  [{index}] {stock_name} - Investing.com still blocked after "
+                        f"{INVESTING_MAX_RETRIES} attempts: {e}"
+                    )
             except Exception as e:
                 if attempt < INVESTING_MAX_RETRIES - 1:
                     delay = INVESTING_RETRY_DELAY * (2 ** attempt)
@@ -128,6 +174,7 @@ async def process_single_stock_async(row_num: int, stock_name: str, investing_ur
                         f"  [{index}] {stock_name} - Investing.com error: {e}, "
                         f"retrying in {delay}s (attempt {attempt + 1}/{INVESTING_MAX_RETRIES})"
                     )
+                    record_retry(investing_url, delay)
                     await asyncio.sleep(delay)
                 else:
                     logger.error(
@@ -135,49 +182,72 @@ async def process_single_stock_async(row_num: int, stock_name: str, investing_ur
                         f"{INVESTING_MAX_RETRIES} attempts: {e}"
                     )
 
+        if investing_price is not None:
+            await store_price('investing', canonicalize_url(investing_url), target_date,
+                              {'close': investing_price, 'currency': currency})
+    add_time('investing', time.perf_counter() - investing_started)
+
     return row_num, stock_name, investing_price, currency
 
 
-async def process_excel_file(file_content: bytes, date: datetime, reparse_mode: bool = False, limit: int | None = None) -> tuple[bytes, str]:
-    temp_input = Path(f"/tmp/us_input_{os.getpid()}.xlsx")
-    temp_output = Path(f"/tmp/us_output_{os.getpid()}.xlsx")
+@dataclass(slots=True)
+class StockRow:
+    row_num: int
+    stock_name: str | None
+    investing_url: str | None
 
-    try:
-        temp_input.write_bytes(file_content)
 
-        logger.info(f"Loading Excel file...")
-        wb = openpyxl.load_workbook(temp_input)
-        ws = wb.active
+def fetch_stocks(stocks: list[StockRow], indexes: list[int], target_date: str):
+    async def fetch_stock(i: int, stock: StockRow):
+        started = time.perf_counter()
+        try:
+            return await process_single_stock_async(
+                stock.row_num,
+                stock.stock_name,
+                stock.investing_url,
+                target_date,
+                indexes[i] + 1
+            )
+        finally:
+            add_row_time(f"{stock.stock_name} (row {stock.row_num})", time.perf_counter() - started)
+
+    return run_pool(stocks, BATCH_SIZE, fetch_stock)
 
-        ws.cell(1, 4).value = date.strftime('%d.%m.%Y')
 
-        target_date = format_date_for_api(date)
+async def process_shard(context: dict, indexes: list[int], items: list) -> list:
+    stocks = [StockRow(*item) for item in items]
+    results = [None] * len(stocks)
+    async for i, result in fetch_stocks(stocks, indexes, context['target_date']):
+        results[i] = result
+    return results
 
-        stocks_data = []
-        row_num = 4
 
-        while True:
-            isin = ws.cell(row_num, 2).value
-            if not isin:
-                break
+async def process_excel_file(file_content: bytes, date: datetime, reparse_mode: bool = False, limit: int | None = None,
+                             stats: JobStats | None = None, job_id: str | None = None) -> tuple[bytes, str]:
+    stats = stats or JobStats()
+    stats_token = current_job_stats.set(stats)
+    mode = 'reparse' if reparse_mode else 'parse'
 
-            col_e = ws.cell(row_num, 5).value
+    try:
+        # Only the result cells are kept in memory, the workbook itself is streamed
+        # once to find the rows and patched once on save
+        cells = {(1, 4): date.strftime('%d.%m.%Y')}
+        stocks_data = []
 
-            if reparse_mode:
-                if col_e != "ERROR":
-                    row_num += 1
-                    continue
+        logger.info(f"Reading Excel file...")
+        with stats.stage('load'):
+            async with aclosing(iter_cpu(iter_sheet_rows(file_content, max_col=9, min_row=4))) as rows:
+                async for row_num, values in rows:
+                    isin = values[1]
+                    if not isin:
+                        break
 
-            stock_name = ws.cell(row_num, 3).value
-            investing_url = ws.cell(row_num, 9).value
+                    if reparse_mode and values[4] != "ERROR":
+                        continue
 
-            stocks_data.append({
-                'row_num': row_num,
-                'stock_name': stock_name,
-                'investing_url': investing_url
-            })
+                    stocks_data.append(StockRow(row_num, values[2], values[8]))
 
-            row_num += 1
+        target_date = format_date_for_api(date)
 
         if limit is not None:
             stocks_data = stocks_data[:limit]
@@ -186,36 +256,35 @@ async def process_excel_file(file_content: bytes, date: datetime, reparse_mode:
 
         mode_str = "REPARSE (ERROR rows only)" if reparse_mode else "FULL"
         logger.info(f"\nProcessing {total_rows} stocks for date: {date.strftime('%d.%m.%Y')} [Mode: {mode_str}]")
-        logger.info(f"Using batch size: {BATCH_SIZE} concurrent requests")
+        logger.info(f"Using up to {BATCH_SIZE} concurrent requests")
         logger.info("-" * 80)
 
-        # Phase 1: fetch prices and currencies from Investing.com
-        fetch_results = []
-        for batch_start in range(0, total_rows, BATCH_SIZE):
-            batch_end = min(batch_start + BATCH_SIZE, total_rows)
-            batch = stocks_data[batch_start:batch_end]
-
-            logger.info(
-                f"\nFetching batch {batch_start // BATCH_SIZE + 1}/"
-                f"{(total_rows + BATCH_SIZE - 1) // BATCH_SIZE} "
-                f"(stocks {batch_start + 1}-{batch_end})..."
-            )
-
-            tasks = [
-                process_single_stock_async(
-                    stock['row_num'],
-                    stock['stock_name'],
-                    stock['investing_url'],
-                    target_date,
-                    batch_start + i + 1
+        # Phase 1: fetch prices and currencies from Investing.com, locally or spread over replicas
+        # Rows finished before a restart come from the checkpoint, only the rest is fetched
+        done = await load_checkpoint(job_id) if job_id is not None else {}
+        pending = [i for i in range(total_rows) if i not in done]
+        if done:
+            logger.info(f"Resuming from checkpoint: {len(done)} rows done, {len(pending)} to fetch")
+
+        fetch_results = list(done.items())
+        with stats.stage('fetch'):
+            if job_id is not None and should_shard(len(pending)):
+                results = await run_sharded(job_id, pending, [astuple(stocks_data[i]) for i in pending],
+                                            lambda chunk: {'target_date': target_date}, total_rows)
+                fetch_results.extend(
+                    (i, results.get(i, TimeoutError("shard did not finish before the deadline")))
+                    for i in pending
                 )
-                for i, stock in enumerate(batch)
-            ]
-
-            batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-            fetch_results.extend(zip(range(batch_start, batch_end), batch_results))
+            else:
+                async for j, result in fetch_stocks([stocks_data[i] for i in pending], pending, target_date):
+                    if job_id is not None and not isinstance(result, Exception):
+                        await save_checkpoint(job_id, {pending[j]: result})
+                    fetch_results.append((pending[j], result))
+                    if len(fetch_results) % BATCH_SIZE == 0 or len(fetch_results) == total_rows:
+                        logger.info(f"Fetched {len(fetch_results)}/{total_rows} stocks")
 
-            await asyncio.sleep(0.3)
+        observe_fetch_rate(mode, len(pending), stats.stages['fetch'])
+        fetch_results.sort(key=lambda item: item[0])
 
         # Phase 2: fetch CBR rates for all currencies found
         currency_codes = set()
@@ -227,7 +296,8 @@ async def process_excel_file(file_content: bytes, date: datetime, reparse_mode:
 
         if currency_codes:
             logger.info(f"\nFetching exchange rates from CBR for: {', '.join(sorted(currency_codes))}...")
-            currency_rates = await get_currency_rates_from_cbr(date, currency_codes)
+            with stats.stage('cbr'):
+                currency_rates = await get_currency_rates_from_cbr(date, currency_codes)
             for code, rate in currency_rates.items():
                 logger.info(f"  {code}: {rate} RUB")
             missing = currency_codes - currency_rates.keys()
@@ -241,6 +311,7 @@ async def process_excel_file(file_content: bytes, date: datetime, reparse_mode:
         error_count = 0
 
         for global_i, result in fetch_results:
+            record_row(mode, isinstance(result, Exception))
             if isinstance(result, Exception):
                 logger.error(f"  [{global_i + 1}] Error: {result}")
                 continue
@@ -249,24 +320,24 @@ async def process_excel_file(file_content: bytes, date: datetime, reparse_mode:
 
             logger.info(f"  [{global_i + 1}] {stock_name}")
 
-            ws.cell(row_num, 4).value = date.strftime('%d.%m.%Y')
+            cells[(row_num, 4)] = date.strftime('%d.%m.%Y')
 
             if investing_price is not None:
                 normalized_price = normalize_price(investing_price)
-                ws.cell(row_num, 5).value = normalized_price
+                cells[(row_num, 5)] = normalized_price
                 if currency:
-                    ws.cell(row_num, 6).value = currency
+                    cells[(row_num, 6)] = currency
                 logger.info(f"    Investing.com: ✓ {normalized_price} ({currency})")
                 successful += 1
 
                 rate = currency_rates.get(currency) if currency else None
                 if rate is not None:
-                    ws.cell(row_num, 7).value = rate
-                    ws.cell(row_num, 8).value = round(normalized_price * rate, 2)
+                    cells[(row_num, 7)] = rate
+                    cells[(row_num, 8)] = round(normalized_price * rate, 2)
                 elif currency:
                     logger.warning(f"    No rate available for currency: {currency}")
-            elif stocks_data[global_i].get('investing_url'):
-                ws.cell(row_num, 5).value = "ERROR"
+            elif stocks_data[global_i].investing_url:
+                cells[(row_num, 5)] = "ERROR"
                 logger.info(f"    Investing.com: ✗ Not found (ERROR)")
                 error_count += 1
             else:
@@ -280,34 +351,71 @@ async def process_excel_file(file_content: bytes, date: datetime, reparse_mode:
             f"  ERRORs: {error_count}"
         )
         logger.info(summary)
+        for limiter in limiter_stats():
+            logger.info(f"Rate limiter {limiter['host']}: {limiter}")
+        for breaker in breaker_stats():
+            logger.info(f"Circuit breaker {breaker['host']}: {breaker}")
 
         logger.info(f"\nSaving results...")
-        wb.save(temp_output)
-
-        result_content = temp_output.read_bytes()
+        with stats.stage('save'):
+            result_content = await run_cpu(write_cells, file_content, cells)
 
         return result_content, summary
 
     finally:
-        temp_input.unlink(missing_ok=True)
-        temp_output.unlink(missing_ok=True)
+        current_job_stats.reset(stats_token)
+
+
+async def store_job_report(job_data: dict, status: str, stats: JobStats, profiled: bool = False) -> dict:
+    report = {
+        'job_id': job_data['job_id'],
+        'user_id': job_data['user_id'],
+        'filename': job_data.get('filename'),
+        'mode': job_data.get('mode', 'parse'),
+        'status': status,
+        'profiled': profiled,
+        **stats.as_dict(),
+    }
+    try:
+        r = await get_redis()
+        await r.set(f"{REPORT_PREFIX}:{report['job_id']}", json.dumps(report, ensure_ascii=False), ex=JOB_REPORT_TTL)
+    except Exception as e:
+        logger.warning(f"Could not store the report of job {report['job_id']}: {e}")
+    return report
+
+
+async def publish_job_error(job_data: dict, error: str, report: dict | None = None):
+    r = await get_redis()
+    error_data = {
+        'job_id': job_data['job_id'],
+        'user_id': job_data['user_id'],
+        'status': 'error',
+        'error': error
+    }
+    if report is not None:
+        error_data['report'] = json.dumps(report, ensure_ascii=False)
+
+    await r.xadd(RESULTS_STREAM, error_data, maxlen=STREAM_MAXLEN, approximate=True)
 
 
 async def process_job(job_data: dict):
     job_id = job_data['job_id']
     user_id = job_data['user_id']
     filename = job_data['filename']
-    file_content = bytes.fromhex(job_data['file_content'])
     mode = job_data.get('mode', 'parse')
     reparse_mode = (mode == 'reparse')
 
-    if reparse_mode:
-        temp_file = Path(f"/tmp/us_check_{os.getpid()}.xlsx")
-        try:
-            temp_file.write_bytes(file_content)
-            wb = openpyxl.load_workbook(temp_file)
-            ws = wb.active
-            date_value = ws.cell(1, 4).value
+    try:
+        file_content = await unpack_payload(await get_binary_redis(), job_data)
+    except Exception as e:
+        logger.error(f"❌ Job {job_id}: could not read the uploaded file: {e}")
+        await publish_job_error(job_data, f"Could not read the uploaded file: {e}")
+        return
+
+    # A bad date is the user's error: reported and acked, not left pending for redelivery
+    try:
+        if reparse_mode:
+            date_value = await run_cpu(read_cell, file_content, 1, 4)
 
             if isinstance(date_value, datetime):
                 date = date_value
@@ -317,11 +425,14 @@ async def process_job(job_data: dict):
                 date = datetime.strptime(date_str, '%d.%m.%Y')
             else:
                 raise ValueError("Date not found in Excel file (cell D1)")
-        finally:
-            temp_file.unlink(missing_ok=True)
-    else:
-        date_str = job_data['date']
-        date = datetime.strptime(date_str, '%d.%m.%Y')
+        else:
+            date_str = job_data['date']
+            date = datetime.strptime(date_str, '%d.%m.%Y')
+    except Exception as e:
+        logger.error(f"❌ Job {job_id}: invalid date: {e}")
+        await publish_job_error(job_data, f"Invalid date: {e}")
+        await drop_payload(await get_redis(), job_data)
+        return
 
     limit_str = job_data.get('limit')
     limit = int(limit_str) if limit_str else None
@@ -335,8 +446,18 @@ async def process_job(job_data: dict):
     logger.info(f"📋 Limit: {limit if limit is not None else 'all rows'}")
     logger.info(f"{'=' * 80}\n")
 
+    stats = JobStats()
+    profiled = await should_profile(job_data)
+    started = time.perf_counter()
     try:
-        result_content, summary = await process_excel_file(file_content, date, reparse_mode, limit)
+        # a weekend or holiday fails right away or moves to the previous trading day (TRADING_CALENDAR_MODE)
+        date, calendar_note = await resolve_trading_date(TRADING_EXCHANGE, date)
+        async with profile_job(job_id, user_id, profiled):
+            result_content, summary = await process_excel_file(file_content, date, reparse_mode, limit,
+                                                               stats=stats, job_id=job_id)
+        if calendar_note:
+            summary = f"⚠️ {calendar_note}\n\n{summary}"
+        report = await store_job_report(job_data, 'success', stats, profiled)
 
         r = await get_redis()
         result_data = {
@@ -344,30 +465,37 @@ async def process_job(job_data: dict):
             'user_id': user_id,
             'status': 'success',
             'filename': filename,
-            'file_content': result_content.hex(),
-            'summary': summary
+            'summary': summary,
+            'report': json.dumps(report, ensure_ascii=False)
         }
+        result_data.update(await pack_payload(r, result_content, f"{BLOB_PREFIX}:{job_id}:result"))
 
-        await r.xadd(RESULTS_STREAM, result_data)
+        await r.xadd(RESULTS_STREAM, result_data, maxlen=STREAM_MAXLEN, approximate=True)
+        observe_job(mode, 'success', time.perf_counter() - started)
         logger.info(f"\n✅ Job {job_id} completed successfully!")
 
     except Exception as e:
         logger.error(f"\n❌ Job {job_id} failed with error: {e}")
         traceback.print_exc()
 
-        r = await get_redis()
-        error_data = {
-            'job_id': job_id,
-            'user_id': user_id,
-            'status': 'error',
-            'error': str(e)
-        }
+        observe_job(mode, 'error', time.perf_counter() - started)
+        await publish_job_error(job_data, str(e), await store_job_report(job_data, 'error', stats, profiled))
 
-        await r.xadd(RESULTS_STREAM, error_data)
+    await clear_checkpoint(job_id)
+    await drop_payload(await get_redis(), job_data)
 
 
 async def main():
     r = await get_redis()
+    rb = await get_binary_redis()
+    configure_instrument_cache(r, INSTRUMENT_CACHE_PREFIX)
+    configure_distributed_limiter(r)
+    configure_price_cache(r, PRICE_CACHE_PREFIX)
+    configure_checkpoints(r, CHECKPOINT_PREFIX)
+    configure_sharding(r, SHARDS_STREAM, CONSUMER_GROUP)
+    configure_profiling(r, PROFILE_PREFIX)
+    configure_trading_calendar(r, CALENDAR_PREFIX)
+    start_metrics_server()
 
     try:
         await r.xgroup_create(JOBS_STREAM, CONSUMER_GROUP, id='0', mkstream=True)
@@ -381,31 +509,100 @@ async def main():
     logger.info(f"🚀 US Parser service started!")
     logger.info(f"👂 Listening for jobs on stream: {JOBS_STREAM}")
     logger.info(f"🔧 Batch size: {BATCH_SIZE}")
+    logger.info(f"🔧 Concurrent jobs: {MAX_CONCURRENT_JOBS}")
     logger.info(f"{'=' * 80}\n")
 
-    while True:
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+
+    slots = asyncio.Semaphore(MAX_CONCURRENT_JOBS)
+    running = set()
+    # Every worker also takes shards of large jobs, including the ones it coordinates itself
+    shard_consumer = asyncio.create_task(consume_shards(CONSUMER_NAME, process_shard, stopping))
+    monitors = [
+        asyncio.create_task(monitor_queues(r, [(JOBS_STREAM, CONSUMER_GROUP), (SHARDS_STREAM, CONSUMER_GROUP)])),
+        asyncio.create_task(monitor_loop_lag()),
+    ]
+    start_loop_watchdog(on_stall=record_loop_stall)
+
+    async def handle_message(message_id: str, job_data: dict, deliveries: int = 1):
         try:
-            messages = await r.xreadgroup(
-                CONSUMER_GROUP,
-                f'worker-{os.getpid()}',
-                {JOBS_STREAM: '>'},
-                count=1,
-                block=1000
-            )
+            if deliveries > JOB_MAX_DELIVERIES:
+                logger.error(f"Job {job_data.get('job_id')} was delivered {deliveries} times, giving up on it")
+                await publish_job_error(job_data, "The job kept crashing the parser worker")
+                await clear_checkpoint(job_data['job_id'])
+                await drop_payload(r, job_data)
+            else:
+                async with keep_claimed(r, JOBS_STREAM, CONSUMER_GROUP, CONSUMER_NAME, message_id):
+                    await process_job(job_data)
+            await r.xack(JOBS_STREAM, CONSUMER_GROUP, message_id)
+            await trim_acked(r, JOBS_STREAM, CONSUMER_GROUP)
+        except Exception as e:
+            logger.error(f"Error processing job: {e}")
+            traceback.print_exc()
+        finally:
+            slots.release()
 
-            for stream, stream_messages in messages:
-                for message_id, job_data in stream_messages:
-                    try:
-                        await process_job(job_data)
-                        await r.xack(JOBS_STREAM, CONSUMER_GROUP, message_id)
-                    except Exception as e:
-                        logger.error(f"Error processing job: {e}")
-                        traceback.print_exc()
+    def start_job(message_id: bytes, job_data: dict, deliveries: int = 1):
+        task = asyncio.create_task(handle_message(message_id.decode(), decode_fields(job_data), deliveries))
+        running.add(task)
+        task.add_done_callback(running.discard)
 
-        except Exception as e:
-            logger.error(f"Error reading from Redis stream: {e}")
-            await asyncio.sleep(5)
+    include_own = True
+    next_claim = 0.0
+    try:
+        while not stopping.is_set():
+            # Jobs left pending by a crashed or restarted worker resume from their checkpoints
+            if time.monotonic() >= next_claim:
+                try:
+                    for message_id, job_data, deliveries in await claim_stale_messages(
+                            rb, JOBS_STREAM, CONSUMER_GROUP, CONSUMER_NAME, include_own):
+                        await slots.acquire()
+                        start_job(message_id, job_data, deliveries)
+                    include_own = False
+                except Exception as e:
+                    logger.error(f"Error claiming stale jobs: {e}")
+                next_claim = time.monotonic() + JOB_CLAIM_IDLE / 2
+
+            # A message is only claimed when a job slot is free, so other replicas can take it meanwhile
+            try:
+                await asyncio.wait_for(slots.acquire(), timeout=1.0)
+            except asyncio.TimeoutError:
+                continue
+            try:
+                messages = await rb.xreadgroup(
+                    CONSUMER_GROUP,
+                    CONSUMER_NAME,
+                    {JOBS_STREAM: '>'},
+                    count=1,
+                    block=1000
+                )
+            except Exception as e:
+                slots.release()
+                logger.error(f"Error reading from Redis stream: {e}")
+                await asyncio.sleep(5)
+                continue
 
+            if not messages:
+                slots.release()
+                continue
+
+            for stream, stream_messages in messages:
+                for message_id, job_data in stream_messages:
+                    start_job(message_id, job_data)
+    finally:
+        if running:
+            logger.info(f"Stopping: waiting up to {DRAIN_TIMEOUT:.0f}s for {len(running)} running jobs")
+            await asyncio.wait(list(running), timeout=DRAIN_TIMEOUT)
+        # Jobs still running stay pending with their checkpoints and are resumed after the restart
+        pending = list(running) + [shard_consumer] + monitors
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        await close_sessions()
+        close_executor()
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    run_event_loop(main())